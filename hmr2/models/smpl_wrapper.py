@@ -1,21 +1,32 @@
 import torch
 import numpy as np
 import pickle
-from typing import Optional
+from typing import Optional, Sequence
 import smplx
 from smplx.lbs import vertices2joints
 from smplx.utils import SMPLOutput
-import json
-import os
+
+from ..utils.frame_store import FrameSink
+
+DEFAULT_FRAME_STORE = '/content/drive/MyDrive/4D-Humans/website/output/walking_man'
+# Fields of the SMPL output that can be recorded. 'vertices_decimated' keeps every vertex_stride-th vertex.
+SMPL_OUTPUT_FIELDS = ('joints', 'vertices', 'vertices_decimated', 'body_pose', 'global_orient', 'betas')
+# Fields needed by the gait pipeline
+GAIT_FIELDS = ('joints', 'body_pose', 'global_orient', 'betas')
 
 
 class SMPL(smplx.SMPLLayer):
-    def __init__(self, *args, joint_regressor_extra: Optional[str] = None, update_hips: bool = False, **kwargs):
+    def __init__(self, *args, joint_regressor_extra: Optional[str] = None, update_hips: bool = False,
+                 frame_sink: Optional[FrameSink] = None, record_fields: Sequence[str] = GAIT_FIELDS,
+                 vertex_stride: int = 10, **kwargs):
         """
         Extension of the official SMPL implementation to support more joints.
         Args:
             Same as SMPLLayer.
             joint_regressor_extra (str): Path to extra joint regressor.
+            frame_sink (FrameSink): Sink that receives the outputs of every forward pass. Recording is disabled if None.
+            record_fields (Sequence[str]): Fields of the output to record, from SMPL_OUTPUT_FIELDS.
+            vertex_stride (int): Vertex subsampling factor of the 'vertices_decimated' field.
         """
         super(SMPL, self).__init__(*args, **kwargs)
         smpl_to_openpose = [24, 12, 17, 19, 21, 16, 18, 20, 0, 2, 5, 8, 1, 4,
@@ -25,6 +36,7 @@ class SMPL(smplx.SMPLLayer):
             self.register_buffer('joint_regressor_extra', torch.tensor(pickle.load(open(joint_regressor_extra, 'rb'), encoding='latin1'), dtype=torch.float32))
         self.register_buffer('joint_map', torch.tensor(smpl_to_openpose, dtype=torch.long))
         self.update_hips = update_hips
+        self.set_recording(frame_sink, record_fields, vertex_stride)
         print("Update hips:", self.update_hips)
 
     def forward(self, *args, **kwargs) -> SMPLOutput:
@@ -42,57 +54,43 @@ class SMPL(smplx.SMPLLayer):
             joints = torch.cat([joints, extra_joints], dim=1)
         smpl_output.joints = joints
 
-        # Extract pose parameters
-        pose_params = smpl_output.body_pose
-        root_orientation = smpl_output.global_orient
-        shape_params = smpl_output.betas
-
-        print("Pose Parameters (Body Pose):", pose_params)
-        print("Root Orientation (Global Orient):", root_orientation)
-        print("Shape Parameters (Betas):", shape_params)
-
-        # Save SMPL Output to JSON
-        self.save_smpl_output_to_json(smpl_output, file_path='/content/drive/MyDrive/4D-Humans/website/output/walking_man.json')
+        # Append SMPL output to the frame sink, if recording is enabled
+        if self.frame_sink is not None:
+            self.record(smpl_output)
 
         return smpl_output
 
-    @staticmethod
-    def save_smpl_output_to_json(smpl_output, file_path='/content/drive/MyDrive/4D-Humans/website/output/walking_man.json'):
+    def set_recording(self, frame_sink: Optional[FrameSink], record_fields: Sequence[str] = GAIT_FIELDS,
+                      vertex_stride: int = 10) -> None:
         """
-        Append SMPL output to a JSON file instead of overwriting it.
+        Configure which outputs of the forward pass are recorded and where.
         Args:
-            smpl_output (SMPLOutput): Output from the SMPL forward pass.
-            file_path (str): Path to save the JSON file.
+            frame_sink (FrameSink): Sink that receives the recorded outputs. Recording is disabled if None.
+            record_fields (Sequence[str]): Fields of the output to record, from SMPL_OUTPUT_FIELDS.
+            vertex_stride (int): Vertex subsampling factor of the 'vertices_decimated' field.
         """
-        smpl_data = {
-            'joints': smpl_output.joints.detach().cpu().numpy().tolist() if smpl_output.joints is not None else None,
-            'vertices': smpl_output.vertices.detach().cpu().numpy().tolist() if smpl_output.vertices is not None else None,
-            'body_pose': smpl_output.body_pose.detach().cpu().numpy().tolist() if smpl_output.body_pose is not None else None,
-            'global_orient': smpl_output.global_orient.detach().cpu().numpy().tolist() if smpl_output.global_orient is not None else None,
-            'betas': smpl_output.betas.detach().cpu().numpy().tolist() if smpl_output.betas is not None else None,
-            'camera_translation': smpl_output.translation.detach().cpu().numpy().tolist() if hasattr(smpl_output, 'translation') else None,
-        }
-
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-        # Load existing data if the file already exists
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as json_file:
-                try:
-                    existing_data = json.load(json_file)
-                    if not isinstance(existing_data, list):
-                        existing_data = [existing_data]
-                except json.JSONDecodeError:
-                    existing_data = []
-        else:
-            existing_data = []
+        unknown_fields = set(record_fields) - set(SMPL_OUTPUT_FIELDS)
+        if unknown_fields:
+            raise ValueError(f'Unknown SMPL output fields {sorted(unknown_fields)}, expected any of {SMPL_OUTPUT_FIELDS}')
+        if vertex_stride < 1:
+            raise ValueError(f'vertex_stride must be positive, got {vertex_stride}')
+        self.frame_sink = frame_sink
+        self.record_fields = tuple(record_fields)
+        self.vertex_stride = vertex_stride
 
-        # Append new data
-        existing_data.append(smpl_data)
-
-        # Write updated JSON file
-        with open(file_path, 'w') as json_file:
-            json.dump(existing_data, json_file, indent=4)
-
-        print(f"SMPL output appended to {file_path}")
\ No newline at end of file
+    def record(self, smpl_output: SMPLOutput) -> None:
+        """
+        Append the SMPL output of a forward pass to the frame sink.
+        Tensors are only detached here; the device transfer is left to the sink (see AsyncFrameSink).
+        Args:
+            smpl_output (SMPLOutput): Output from the SMPL forward pass.
+        """
+        arrays = {}
+        for name in self.record_fields:
+            if name == 'vertices_decimated':
+                value = smpl_output.vertices[:, ::self.vertex_stride] if smpl_output.vertices is not None else None
+            else:
+                value = getattr(smpl_output, name, None)
+            if value is not None:
+                arrays[name] = value.detach()
+        self.frame_sink.write(arrays)
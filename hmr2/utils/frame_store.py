@@ -0,0 +1,280 @@
+import atexit
+import json
+import os
+import queue
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+META_FILE = 'meta.json'
+FRAME_INDEX = 'frame_index'
+BATCH_INDEX = 'batch_index'
+
+
+def to_numpy(x: Any) -> np.ndarray:
+    """
+    Convert a (possibly GPU) tensor or array-like to a NumPy array.
+    """
+    if hasattr(x, 'detach'):
+        return x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+class FrameSink:
+    """
+    Consumer of per-frame model outputs.
+    Each call to write() receives one batch of outputs as a dictionary of arrays that share the leading batch dimension.
+    """
+
+    def write(self, arrays: Dict[str, np.ndarray]) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class FrameStore(FrameSink):
+    def __init__(self, root: str, chunk_frames: int = 256, overwrite: bool = False):
+        """
+        Append-only binary store for per-frame outputs.
+        Every field is kept in its own raw little-endian file (<root>/<field>.bin) that grows in preallocated
+        chunks, so appending a frame costs O(1) regardless of how many frames were written before.
+        The layout (dtype and per-row shape of every field, number of rows) is kept in <root>/meta.json.
+        Every row also records the index of the write() call it came from and its position inside that batch.
+        Args:
+            root (str): Directory of the store. An existing store is appended to.
+            chunk_frames (int): Number of rows preallocated every time the files need to grow.
+            overwrite (bool): Remove any existing store at root first.
+        """
+        self.root = root
+        self.chunk_frames = chunk_frames
+        if overwrite:
+            FrameStore.clear(root)
+        os.makedirs(root, exist_ok=True)
+
+        self.fields = {}
+        self.count = 0
+        self.num_writes = 0
+        self.capacity = 0
+        self._files = {}
+        meta_path = os.path.join(root, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            self.fields = {name: (np.dtype(spec['dtype']), tuple(spec['shape'])) for name, spec in meta['fields'].items()}
+            self.count = meta['count']
+            self.num_writes = meta.get('num_writes', 0)
+            self._open_files()
+        atexit.register(self.close)
+
+    @staticmethod
+    def clear(root: str) -> None:
+        """
+        Delete the store at root, if any.
+        """
+        if os.path.isdir(root):
+            shutil.rmtree(root)
+
+    def _row_bytes(self, name: str) -> int:
+        dtype, shape = self.fields[name]
+        return dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+
+    def _open_files(self) -> None:
+        for name in self.fields:
+            path = os.path.join(self.root, f'{name}.bin')
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            self._files[name] = open(path, 'r+b')
+        # All files grow together, so any of them tells the preallocated capacity
+        name = next(iter(self.fields))
+        self.capacity = max(os.path.getsize(os.path.join(self.root, f'{name}.bin')) // self._row_bytes(name), self.count)
+
+    def _init_fields(self, arrays: Dict[str, np.ndarray]) -> None:
+        self.fields = {name: (array.dtype, array.shape[1:]) for name, array in arrays.items()}
+        self._open_files()
+
+    def _grow(self, min_capacity: int) -> None:
+        while self.capacity < min_capacity:
+            self.capacity += self.chunk_frames
+        for name, f in self._files.items():
+            f.truncate(self.capacity * self._row_bytes(name))
+        self._write_meta()
+
+    def write(self, arrays: Dict[str, np.ndarray]) -> None:
+        """
+        Append one batch of outputs.
+        Args:
+            arrays (Dict[str, np.ndarray]): Arrays of shape (B, ...). All fields must be present on every call.
+        """
+        arrays = {name: np.ascontiguousarray(to_numpy(array)) for name, array in arrays.items()}
+        batch_size = len(next(iter(arrays.values())))
+        arrays[FRAME_INDEX] = np.full(batch_size, self.num_writes, dtype=np.int64)
+        arrays[BATCH_INDEX] = np.arange(batch_size, dtype=np.int64)
+
+        if not self.fields:
+            self._init_fields(arrays)
+        if set(arrays) != set(self.fields):
+            raise ValueError(f'Fields {sorted(arrays)} do not match the store fields {sorted(self.fields)}')
+
+        if self.count + batch_size > self.capacity:
+            self._grow(self.count + batch_size)
+        for name, array in arrays.items():
+            dtype, shape = self.fields[name]
+            if array.shape[1:] != shape:
+                raise ValueError(f'Field {name} has shape {array.shape[1:]}, expected {shape}')
+            f = self._files[name]
+            f.seek(self.count * self._row_bytes(name))
+            f.write(array.astype(dtype, copy=False).tobytes())
+        self.count += batch_size
+        self.num_writes += 1
+
+    def _write_meta(self) -> None:
+        meta = {
+            'count': self.count,
+            'num_writes': self.num_writes,
+            'fields': {name: {'dtype': dtype.str, 'shape': list(shape)} for name, (dtype, shape) in self.fields.items()},
+        }
+        tmp_path = os.path.join(self.root, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.root, META_FILE))
+
+    def flush(self) -> None:
+        for f in self._files.values():
+            f.flush()
+        if self.fields:
+            self._write_meta()
+
+    def close(self) -> None:
+        if not self._files:
+            return
+        # Drop the unused preallocated tail
+        for name, f in self._files.items():
+            f.truncate(self.count * self._row_bytes(name))
+        self.capacity = self.count
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        atexit.unregister(self.close)
+
+
+class AsyncFrameSink(FrameSink):
+    _STOP = object()
+
+    def __init__(self, sink: FrameSink, max_queue: int = 64):
+        """
+        Forward writes to another sink from a background thread.
+        write() only enqueues the arrays (tensors are converted to NumPy on the writer thread), and blocks once
+        max_queue batches are pending so that a slow disk throttles the producer instead of exhausting memory.
+        Errors raised by the wrapped sink are re-raised on the next write(), flush() or close().
+        Args:
+            sink (FrameSink): Sink that performs the actual writes.
+            max_queue (int): Maximum number of pending batches.
+        """
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='frame-sink-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            arrays = self.queue.get()
+            try:
+                if arrays is AsyncFrameSink._STOP:
+                    return
+                if self.error is None:
+                    self.sink.write({name: to_numpy(array) for name, array in arrays.items()})
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def write(self, arrays: Dict[str, Any]) -> None:
+        if self.closed:
+            raise RuntimeError('Cannot write to a closed AsyncFrameSink')
+        self._raise_error()
+        self.queue.put(arrays)
+
+    def flush(self) -> None:
+        """
+        Block until every pending batch has been written, then flush the wrapped sink.
+        """
+        self.queue.join()
+        self._raise_error()
+        self.sink.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(AsyncFrameSink._STOP)
+        self.thread.join()
+        atexit.unregister(self.close)
+        self.sink.close()
+        self._raise_error()
+
+
+class FrameStoreReader:
+    def __init__(self, root: str):
+        """
+        Read-only view of a FrameStore. Fields are exposed as memory-mapped NumPy arrays of shape (N, ...).
+        Args:
+            root (str): Directory of the store.
+        """
+        meta_path = os.path.join(root, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f'No frame store found at {root}')
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        self.root = root
+        self.count = meta['count']
+        self.fields = {name: (np.dtype(spec['dtype']), tuple(spec['shape'])) for name, spec in meta['fields'].items()}
+        self._arrays = {}
+
+    @staticmethod
+    def exists(root: str) -> bool:
+        return os.path.exists(os.path.join(root, META_FILE))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.fields
+
+    def keys(self) -> List[str]:
+        return [name for name in self.fields if name not in (FRAME_INDEX, BATCH_INDEX)]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            dtype, shape = self.fields[name]
+            if self.count == 0:
+                self._arrays[name] = np.empty((0,) + shape, dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(os.path.join(self.root, f'{name}.bin'), dtype=dtype, mode='r',
+                                               shape=(self.count,) + shape)
+        return self._arrays[name]
+
+    def get(self, name: str, default: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        return self[name] if name in self.fields else default
+
+    def first_in_batch(self, name: str) -> np.ndarray:
+        """
+        Rows of a field that were the first element of their batch, i.e. one row per write() call.
+        """
+        if BATCH_INDEX not in self.fields:
+            return self[name]
+        return self[name][self[BATCH_INDEX] == 0]
@@ -1,7 +1,7 @@
 import warnings
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 import os
 import hydra
@@ -17,6 +17,8 @@ from phalp.utils import get_pylogger
 from phalp.configs.base import CACHE_DIR
 
 from hmr2.datasets.utils import expand_bbox_to_aspect_ratio
+from hmr2.models.smpl_wrapper import DEFAULT_FRAME_STORE, GAIT_FIELDS
+from hmr2.utils.frame_store import AsyncFrameSink, FrameStore
 
 warnings.filterwarnings('ignore')
 
@@ -35,6 +37,11 @@ class HMR2Predictor(HMR2018Predictor):
         self.model = model
         self.model.eval()
 
+        # Record per-frame SMPL outputs for the gait pipeline
+        if cfg.smpl_frame_store:
+            self.model.smpl.set_recording(AsyncFrameSink(FrameStore(cfg.smpl_frame_store), max_queue=cfg.smpl_frame_queue),
+                                          record_fields=cfg.smpl_record_fields, vertex_stride=cfg.smpl_vertex_stride)
+
     def forward(self, x):
         hmar_out = self.hmar_old(x)
         batch = {
@@ -168,7 +175,12 @@ class HMR2_4dhuman(PHALP):
 class Human4DConfig(FullConfig):
     # override defaults if needed
     expand_bbox_shape: Optional[Tuple[int]] = (192,256)
-    pass
+    # Where to record per-frame SMPL outputs (None disables recording)
+    smpl_frame_store: Optional[str] = DEFAULT_FRAME_STORE
+    smpl_frame_queue: int = 64
+    # Recorded SMPL output fields; add 'vertices' or 'vertices_decimated' to keep the mesh
+    smpl_record_fields: List[str] = field(default_factory=lambda: list(GAIT_FIELDS))
+    smpl_vertex_stride: int = 10
 
 cs = ConfigStore.instance()
 cs.store(name="config", node=Human4DConfig)
@@ -181,5 +193,10 @@ def main(cfg: DictConfig) -> Optional[float]:
 
     phalp_tracker.track()
 
+    # Wait for the recorder to write out the remaining frames
+    frame_sink = phalp_tracker.HMAR.model.smpl.frame_sink
+    if frame_sink is not None:
+        frame_sink.close()
+
 if __name__ == "__main__":
     main()
@@ -1,26 +1,24 @@
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.animation import FuncAnimation, FFMpegWriter
-from scipy.ndimage import gaussian_filter1d
+from preprocessing import load_walk
+from skeleton_renderer import SKELETON_CONNECTIONS, render_skeleton_video, render_skeleton_video_parallel
+from trajectory_filters import gaussian_smooth
 
-def load_smpl_output(json_path):
-
-    with open(json_path, 'r') as f:
-        data = json.load(f)
-    if 'frames' not in data:
-        raise ValueError("Invalid JSON format: Missing 'frames' key.")
-    return data['frames']
+def load_smpl_output(source):
+    # source is a preprocessed walk (in memory or .npy) or a frame store directory
+    frames = load_walk(source)
+    if 'joints' not in frames:
+        raise ValueError("Invalid frame data: Missing 'joints' field.")
+    return frames
 
 def smooth_joints(joints, sigma=1.0):
-    # Apply smoothing across frames for each joint's x, y, z coordinates
-    smoothed_joints = np.zeros_like(joints)
-    for i in range(joints.shape[1]):  # For each joint
-        smoothed_joints[:, i, :] = gaussian_filter1d(joints[:, i, :], sigma=sigma, axis=0, mode='nearest')
-    return smoothed_joints
+    # Apply smoothing across frames to every joint's x, y, z coordinates at once
+    return gaussian_smooth(joints, sigma=sigma)
 
 def plot_smpl_data(joints, vertices, ax):
+    # vertices is None when only the joints were recorded
 
     ax.clear()
     ax.set_title('SMPL Model Animation')
@@ -31,70 +29,53 @@ def plot_smpl_data(joints, vertices, ax):
     x_j, y_j, z_j = joints[:, 0], joints[:, 1], joints[:, 2]
     ax.scatter(x_j, y_j, z_j, c='red', marker='o', s=80, label='Joints', edgecolors='black', linewidth=1.2)
 
-    x_v, y_v, z_v = vertices[:, 0], vertices[:, 1], vertices[:, 2]
-    ax.scatter(x_v, y_v, z_v, c='blue', marker='.', alpha=0.2, s=5, label='Vertices')
-
-    connections = [
-    (0, 9),  # Pelvis to Spine1
-    (9, 10),  # Spine1 to Spine2
-    (10, 11),  # Spine2 to Spine3
-    (11, 12),  # Spine3 to Neck
-    (12, 13),  # Neck to Head
-
-    (9, 14),  # Spine1 to Left Shoulder
-    (14, 15),  # Left Shoulder to Left Elbow
-    (15, 16),  # Left Elbow to Left Wrist
-
-    (9, 17),  # Spine1 to Right Shoulder
-    (17, 18),  # Right Shoulder to Right Elbow
-    (18, 19),  # Right Elbow to Right Wrist
-
-    (0, 1),  # Pelvis to Left Hip
-    (1, 2),  # Left Hip to Left Knee
-    (2, 3),  # Left Knee to Left Ankle
-    (3, 4),  # Left Ankle to Left Foot
-
-    (0, 5),  # Pelvis to Right Hip
-    (5, 6),  # Right Hip to Right Knee
-    (6, 7),  # Right Knee to Right Ankle
-    (7, 8)   # Right Ankle to Right Foot
-    ]
-    for start, end in connections:
+    if vertices is not None:
+        x_v, y_v, z_v = vertices[:, 0], vertices[:, 1], vertices[:, 2]
+        ax.scatter(x_v, y_v, z_v, c='blue', marker='.', alpha=0.2, s=5, label='Vertices')
+
+    for start, end in SKELETON_CONNECTIONS:
         ax.plot([x_j[start], x_j[end]], [y_j[start], y_j[end]], [z_j[start], z_j[end]], color='black', linewidth=2)
 
     ax.legend()
 
 def animate(i, frames, ax, joints_data, sigma=1.0):
-    frame = frames[i]
-    if 'joints' in frame and 'vertices' in frame:
-        joints = np.array(frame['joints'])
-        vertices = np.array(frame['vertices'])
-
-        # Apply Gaussian smoothing to joints over time
-        smoothed_joints = joints_data[i]  # Use the precomputed smoothed joints for each frame
-
-        plot_smpl_data(smoothed_joints, vertices, ax)
-
-def save_smpl_animation(json_path, output_path, sigma=1.0):
-    frames = load_smpl_output(json_path)
-
-    # Preprocess all joint data across frames and apply Gaussian smoothing
-    joints_data = []
-    for frame in frames:
-        if 'joints' in frame:
-            joints = np.array(frame['joints'])
-            joints_data.append(joints)
-    joints_data = np.array(joints_data)
-
-    # Apply Gaussian smoothing over all frames
-    smoothed_joints_data = smooth_joints(joints_data, sigma=sigma)
+    vertices = frames['vertices'][i] if 'vertices' in frames else None
+
+    # Apply Gaussian smoothing to joints over time
+    smoothed_joints = joints_data[i]  # Use the precomputed smoothed joints for each frame
+
+    plot_smpl_data(smoothed_joints, vertices, ax)
+
+def save_smpl_animation(source, output_path, sigma=1.0, renderer='opencv', num_workers=1):
+    # renderer='opencv' rasterises frames with NumPy/OpenCV and pipes them to ffmpeg,
+    # renderer='matplotlib' draws every frame as a 3D matplotlib figure (much slower)
+    # num_workers > 1 splits the opencv rendering of long recordings across a thread pool
+    frames = load_smpl_output(source)
+
+    if 'joints_smoothed' in frames:
+        # Smoothed once during preprocessing, shared with the gait features
+        smoothed_joints_data = np.asarray(frames['joints_smoothed'])
+    else:
+        # Load all joint data across frames and apply Gaussian smoothing
+        smoothed_joints_data = smooth_joints(np.asarray(frames['joints']), sigma=sigma)
+
+    if renderer == 'opencv':
+        vertices = frames['vertices'] if 'vertices' in frames else None
+        if num_workers > 1:
+            render_skeleton_video_parallel(smoothed_joints_data, output_path, vertices=vertices, fps=30, num_workers=num_workers)
+        else:
+            render_skeleton_video(smoothed_joints_data, output_path, vertices=vertices, fps=30)
+        print(f"Animation saved as {output_path}")
+        return
+    if renderer != 'matplotlib':
+        raise ValueError(f"Unknown renderer: {renderer}")
 
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111, projection='3d')
 
     ax.view_init(elev=100, azim=90)
 
-    ani = FuncAnimation(fig, animate, frames=len(frames), fargs=(frames, ax, smoothed_joints_data, sigma), interval=33)  # 30 FPS
+    ani = FuncAnimation(fig, animate, frames=len(smoothed_joints_data), fargs=(frames, ax, smoothed_joints_data, sigma), interval=33)  # 30 FPS
     writer = FFMpegWriter(fps=30, bitrate=1800)
     ani.save(output_path, writer=writer)
     print(f"Animation saved as {output_path}")
@@ -1,21 +1,29 @@
 from flask import Flask, request, jsonify, send_file, send_from_directory, redirect, url_for, session, current_app
 from pyngrok import ngrok
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from flask_ngrok import run_with_ngrok
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, LargeBinary, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import relationship
+import io
 import os
+import shutil
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import subprocess
-import threading
-import io
-import json
+from hmr2.utils.frame_store import FrameStoreReader
 from animations import save_smpl_animation
 from main import results 
 from gait_database import human_identification
+from tracking_service import get_tracking_service
+from preprocessing import PreprocessCache
+from job_queue import Job, JobQueue, JOB_FAILED
+from db import USERS_DATABASE_URL, add_missing_columns, add_missing_indexes, get_engine, get_scoped_session, remove_sessions
+from stage_graph import StageGraph, StageMemo
+from result_cache import ResultCache, RESULT_CACHE_BYTES
+from workspace import JobWorkspace
+from blob_store import BlobStore
+from chunked_upload import UploadManager, UploadOffsetError, UPLOAD_MAX_IDLE
 
 
 # Set up Flask
@@ -31,9 +39,13 @@ login_manager.login_view = "loginpage"
 
 # Define SQLAlchemy ORM Base and Database
 Base = declarative_base()
-DATABASE_URL = "sqlite:///users.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = get_engine(USERS_DATABASE_URL)
+# One session per request or job thread
+SessionLocal = get_scoped_session(USERS_DATABASE_URL)
+
+@app.teardown_appcontext
+def release_db_sessions(exception=None):
+    remove_sessions()
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -62,9 +74,14 @@ class Video(Base):
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    video = Column(LargeBinary, nullable=False)
-    mesh = Column(LargeBinary, nullable=True)
-    animate = Column(LargeBinary, nullable=True)
+    filename = Column(String, nullable=True)
+    # SHA-256 of the files in the blob store
+    video_hash = Column(String(64), nullable=False, index=True)
+    video_size = Column(Integer, nullable=False)
+    mesh_hash = Column(String(64), nullable=True)
+    animate_hash = Column(String(64), nullable=True)
+    # Frames decoded while the video was being uploaded, if any
+    frames_dir = Column(String, nullable=True)
 
     # Relationship to User table
     user = relationship("User", back_populates="videos")
@@ -74,7 +91,72 @@ class Video(Base):
 # Create the tables in the database
 Base.metadata.create_all(engine)
 
-TRACK_SCRIPT_PATH = "/content/drive/MyDrive/4D-Humans/track.py"
+# Video files live on disk, the database only keeps their hashes
+blob_store = BlobStore()
+upload_manager = UploadManager(blob_store, max_idle=int(os.environ.get("GAIT_UPLOAD_MAX_IDLE", UPLOAD_MAX_IDLE)))
+upload_manager.start()
+
+# Earlier versions kept the video, mesh and animation files in the videos table itself (columns video, mesh
+# and animate). Copy them into the blob store once, then rebuild the table without them: SQLite can neither
+# drop the NOT NULL video column nor the columns themselves on older versions. Users are left untouched.
+LEGACY_VIDEO_COLUMNS = {"video": "video_hash", "mesh": "mesh_hash", "animate": "animate_hash"}
+
+def migrate_legacy_videos():
+    add_missing_columns(engine, Video.__table__)
+    existing_columns = {column['name'] for column in inspect(engine).get_columns(Video.__table__.name)}
+    legacy_columns = [name for name in LEGACY_VIDEO_COLUMNS if name in existing_columns]
+    if not legacy_columns:
+        add_missing_indexes(engine, Video.__table__)
+        return
+
+    print("Moving stored videos into the blob store...")
+    with engine.begin() as connection:
+        video_ids = connection.execute(text("SELECT id FROM videos WHERE video_hash IS NULL")).scalars().all()
+        for video_id in video_ids:
+            # One row at a time, so that only one video is in memory
+            row = connection.execute(text(f"SELECT {', '.join(legacy_columns)} FROM videos WHERE id = :id"),
+                                     {"id": video_id}).one()
+            digests = {"id": video_id, "video_hash": None, "video_size": 0, "mesh_hash": None, "animate_hash": None}
+            for name, data in zip(legacy_columns, row):
+                if data is None:
+                    continue
+                digest, size = blob_store.put_stream(io.BytesIO(data))
+                digests[LEGACY_VIDEO_COLUMNS[name]] = digest
+                if name == "video":
+                    digests["video_size"] = size
+            connection.execute(text("UPDATE videos SET video_hash = :video_hash, video_size = :video_size, "
+                                    "mesh_hash = :mesh_hash, animate_hash = :animate_hash WHERE id = :id"), digests)
+
+        # Rebuild the table with the current columns only, in the same transaction
+        columns = ", ".join(column.name for column in Video.__table__.columns)
+        connection.execute(text("ALTER TABLE videos RENAME TO videos_legacy"))
+        for table_index in inspect(connection).get_indexes("videos_legacy"):
+            connection.execute(text(f"DROP INDEX {table_index['name']}"))
+        Video.__table__.create(connection)
+        connection.execute(text(f"INSERT INTO videos ({columns}) SELECT {columns} FROM videos_legacy"))
+        connection.execute(text("DROP TABLE videos_legacy"))
+    print(f"Moved {len(video_ids)} stored videos into the blob store.")
+
+migrate_legacy_videos()
+
+# Preprocessed walks of the running jobs
+preprocess_cache = PreprocessCache()
+
+def artifact_in_use(digest):
+    session = SessionLocal()
+    try:
+        return session.query(Video.id).filter((Video.video_hash == digest) | (Video.mesh_hash == digest)
+                                              | (Video.animate_hash == digest)).first() is not None
+    finally:
+        session.close()
+
+# Results of analysed videos by content hash; a video uploaded again reuses them instead of being analysed
+result_cache = ResultCache(engine, blob_store, max_bytes=int(os.environ.get("GAIT_RESULT_CACHE_BYTES", RESULT_CACHE_BYTES)),
+                           in_use=artifact_in_use)
+
+# Load the tracking models once, in the background, instead of per upload
+tracking_service = get_tracking_service()
+tracking_service.warmup()
 
 # Route to serve the registration HTML page
 @app.route("/")
@@ -100,18 +182,23 @@ def register():
     
     # Check if the username or email already exists
     session = SessionLocal()
-    existing_user = session.query(User).filter((User.username == username) | (User.email == email)).first()
-    if existing_user:
-        return jsonify({"message": "Username or Email already exists"}), 400
-    
-    # Hash the password
-    hashed_password = generate_password_hash(password)
-    
-    # Create a new user object
-    new_user = User(name=name, username=username, email=email, password=hashed_password)
-    session.add(new_user)
-    session.commit()
-    session.close()
+    try:
+        existing_user = session.query(User).filter((User.username == username) | (User.email == email)).first()
+        if existing_user:
+            return jsonify({"message": "Username or Email already exists"}), 400
+
+        # Hash the password
+        hashed_password = generate_password_hash(password)
+
+        # Create a new user object
+        new_user = User(name=name, username=username, email=email, password=hashed_password)
+        session.add(new_user)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
     # Return a response with a success message and login page URL
     return jsonify({
@@ -184,15 +271,21 @@ def upload_video():
     if not allowed_file(file.filename):
         return jsonify({"message": "Invalid file format. Only MP4 allowed."}), 400
 
-    # Read the file in binary mode
-    video_binary = file.read()
+    # Stream the file to the blob store
+    video_hash, video_size = blob_store.put_stream(file.stream)
 
     # Get the user ID from the logged-in user
     user_id = current_user.id
 
-    # Store the binary data in the database
+    vid_id, job_id = add_video(user_id, secure_filename(file.filename), video_hash, video_size)
+    
+    return jsonify({"message": "Video uploaded successfully. Analysis is running in the background.", "job_id": job_id}), 201
+
+
+def add_video(user_id, filename, video_hash, video_size, frames_dir=None):
+    # Store the video metadata in the database
     session = SessionLocal()
-    new_video = Video(user_id=user_id, video=video_binary)
+    new_video = Video(user_id=user_id, filename=filename, video_hash=video_hash, video_size=video_size, frames_dir=frames_dir)
     session.add(new_video)
     session.commit()
 
@@ -200,157 +293,308 @@ def upload_video():
 
     session.close()
 
-    
-    def background_task(vid_id):
-        run_hmr2_model(vid_id)  
+    # Queue the analysis; the worker pool picks it up
+    job_id = job_queue.enqueue(vid_id)
+    return vid_id, job_id
 
-    
-    thread = threading.Thread(target=background_task, args=(vid_id,))
-    thread.daemon = True 
-    thread.start()
-    
-    return jsonify({"message": "Video uploaded successfully. Analysis is running in the background."}), 201
 
+# Routes for chunked, resumable uploads
+@app.route("/uploads", methods=["POST"])
+@login_required
+def create_upload():
+    filename = request.json.get('filename')
+    size = request.json.get('size')
+
+    if not filename or not allowed_file(filename):
+        return jsonify({"message": "Invalid file format. Only MP4 allowed."}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({"message": "The file size is required"}), 400
+
+    upload = upload_manager.create(current_user.id, secure_filename(filename), size)
+    return jsonify(upload.to_dict()), 201
+
+def get_user_upload(upload_id):
+    upload = upload_manager.get(upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        return None
+    return upload
+
+def get_user_finished_upload(upload_id):
+    """Video and job of an upload of the current user that was finished recently, or None."""
+    finished = upload_manager.finished(upload_id)
+    if finished is None or finished[0] != current_user.id:
+        return None
+    return finished[1]
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+@login_required
+def upload_status(upload_id):
+    upload = get_user_upload(upload_id)
+    if upload is None:
+        # The last chunk may have been stored while its response was lost
+        finished = get_user_finished_upload(upload_id)
+        if finished is not None:
+            return jsonify(finished), 200
+        return jsonify({"message": "Upload not found"}), 404
+    return jsonify(upload.to_dict()), 200
+
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+@login_required
+def upload_chunk(upload_id):
+    upload = get_user_upload(upload_id)
+    if upload is None:
+        # A retry of the last chunk gets the same answer as the first attempt
+        finished = get_user_finished_upload(upload_id)
+        if finished is not None:
+            return jsonify(finished), 201
+        return jsonify({"message": "Upload not found"}), 404
+
+    # The chunk is the raw request body, written at the given offset
+    try:
+        offset = upload_manager.append(upload, request.args.get("offset", type=int), request.stream)
+    except UploadOffsetError as e:
+        return jsonify({"message": str(e), **upload.to_dict()}), 409
+
+    if offset < upload.size:
+        return jsonify(upload.to_dict()), 200
+
+    video_hash, video_size, frames_dir = upload_manager.finalize(upload)
+    vid_id, job_id = add_video(upload.user_id, upload.filename, video_hash, video_size, frames_dir)
+    result = {"message": "Video uploaded successfully. Analysis is running in the background.",
+              "upload_id": upload.id, "video_id": vid_id, "job_id": job_id}
+    upload_manager.complete(upload, result)
+    return jsonify(result), 201
+
+@app.route("/uploads/<upload_id>", methods=["DELETE"])
+@login_required
+def cancel_upload(upload_id):
+    upload = get_user_upload(upload_id)
+    if upload is None:
+        return jsonify({"message": "Upload not found"}), 404
+    upload_manager.discard(upload)
+    return jsonify({"message": "Upload cancelled"}), 200
+
+
+def get_user_job(job_id):
+    """The job, if it analyses a video of the current user."""
+    session = SessionLocal()
+    try:
+        job = session.query(Job).join(Video, Video.id == Job.video_id).filter(
+            Job.id == job_id, Video.user_id == current_user.id).first()
+        return job.to_dict() if job else None
+    finally:
+        session.close()
+
+def user_room(user_id):
+    return f"user-{user_id}"
 
+# Route to check the state of an analysis job
+@app.route("/jobs/<int:job_id>")
+@login_required
+def job_status(job_id):
+    job = get_user_job(job_id)
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+    return jsonify(job), 200
+
+@socketio.on("job_status")
+def send_job_status(data):
+    if not current_user.is_authenticated:
+        return
+    # Later updates of the user's jobs are pushed to their room
+    join_room(user_room(current_user.id))
+    try:
+        job_id = int((data or {}).get("job_id"))
+    except (TypeError, ValueError):
+        return
+    job = get_user_job(job_id)
+    if job is not None:
+        emit("job_status", job)
+
+
+
+# Columns of the Video table holding the hash of each downloadable file
+VIDEO_FILES = {"video": "video_hash", "mesh": "mesh_hash", "animation": "animate_hash"}
+
+# Route to retrieve uploaded videos and their results
+@app.route("/videos/<int:video_id>/<kind>")
+@login_required
+def serve_video(video_id, kind):
+    if kind not in VIDEO_FILES:
+        return jsonify({"message": "Unknown video file"}), 404
+
+    session = SessionLocal()
+    video = session.query(Video).filter(Video.id == video_id, Video.user_id == current_user.id).first()
+    session.close()
+
+    digest = getattr(video, VIDEO_FILES[kind]) if video else None
+    if not blob_store.exists(digest):
+        return jsonify({"message": "Video not found"}), 404
+
+    # conditional=True answers Range requests, so players can seek without downloading everything
+    return send_file(blob_store.path(digest), mimetype="video/mp4", conditional=True,
+                     download_name=f"{kind}_{video_id}.mp4")
 
-# Route to retrieve uploaded videos
 def retrieve_video_from_db(video_id, output_filename):
     session = SessionLocal()
     video = session.query(Video).filter(Video.id == video_id).first()
+    session.close()
     if video:
-        # Convert the binary video data back to a file
-        video_stream = io.BytesIO(video.video) 
-        video_stream.seek(0) 
-        
-        # Create a file to write the binary data into
-        with open(output_filename, 'wb') as f:
-            f.write(video_stream.read()) 
-
-        session.close()
-        return output_filename  # Return the path to the saved video file
+        # Frames already decoded during the upload spare the tracker its own extraction
+        if video.frames_dir and os.path.isdir(video.frames_dir):
+            return video.frames_dir
+        return blob_store.materialize(video.video_hash, output_filename)  # Return the path to the video file
     else:
-        session.close()
         raise ValueError("Video not found in the database")
 
-def save_video_to_file(video_data, file_path):
-    """Save the retrieved binary video data to a temporary file."""
-    with open(file_path, 'wb') as f:
-        f.write(video_data)
-    
+def release_decoded_frames(video_id):
+    session = SessionLocal()
+    video = session.query(Video).filter(Video.id == video_id).first()
+    if video and video.frames_dir:
+        shutil.rmtree(os.path.dirname(video.frames_dir), ignore_errors=True)
+        video.frames_dir = None
+        session.commit()
+    session.close()
 
 @app.route("/logout")
 def logout():
     logout_user()
     return redirect(url_for("loginpage"))
 
-def clear_json():
-    json_file_path = "/content/drive/MyDrive/4D-Humans/website/output/walking_man.json"
-    try:
-        with open(json_file_path, 'w') as json_file:
-            json_file.truncate(0)  # Overwrite with an empty object
-        print(f"Cleared JSON file: {json_file_path}")
-    except Exception as e:
-        print(f"Error clearing JSON file: {e}")
-
-def clear_preprocessed_json():
-  json_file_path = "/content/drive/MyDrive/4D-Humans/website/output/walking_man_preprocessed.json"
-  try:
-        with open(json_file_path, 'w') as json_file:
-            json_file.truncate(0)  
-        print(f"Cleared JSON file: {json_file_path}")
-  except Exception as e:
-        print(f"Error clearing JSON file: {e}")
-
-def preprocessdata():
-    json_path='/content/drive/MyDrive/4D-Humans/website/output/walking_man.json'
-    if os.path.exists(json_path) and os.stat(json_path).st_size > 0:
-        with open(json_path, "r") as file:
-            data = json.load(file)
-    else:
-        print("Error: JSON file is empty or missing!")
+def preprocessdata(workspace):
+    smpl_frames = workspace.smpl_frames
+    if not FrameStoreReader.exists(smpl_frames) or len(FrameStoreReader(smpl_frames)) == 0:
+        print("Error: SMPL frame store is empty or missing!")
         return None
 
-    # Iterate over the frames and modify the 'joints' key
-    for frame in data:
-        joints = frame.get('joints')
-        vertices= frame.get('vertices')
-        betas= frame.get('betas')
-        body_pose= frame.get('body_pose')
-        global_orient= frame.get('global_orient')
-
-        frame['joints']=joints[0]
-        frame['vertices']=vertices[0]
-        frame['betas']
-        frame['body_pose']=body_pose[0][0]
-        frame['global_orient']=global_orient[0][0]
-        del frame['camera_translation']
+    # One structured array per walk, shared in memory by the animation and the gait features
+    return preprocess_cache.get(workspace.job_id, smpl_frames, workspace.preprocessed_walk,
+                                smoothing=os.environ.get("GAIT_SMOOTHING", "gaussian"))
 
-    data2 = {
-        "frames": data
-    }
 
-    clear_preprocessed_json()
+def store_video_artifact(video_id, column, file_path):
+    """Save a result video of the job to the blob store and its hash into the given column of the Video row."""
+    digest, _ = blob_store.put_file(file_path)
 
-    # Save the modified data back to a JSON file
-    with open('/content/drive/MyDrive/4D-Humans/website/output/walking_man_preprocessed.json', 'w') as file:
-        json.dump(data2, file, indent=4)
+    session = SessionLocal()
+    existing_video = session.query(Video).filter(Video.id == video_id).first()
+    setattr(existing_video, column, digest)
+    session.commit()
+    session.close()
+    return digest
 
-    print("JSON file modified successfully.")
 
+def set_video_artifacts(video_id, **digests):
+    session = SessionLocal()
+    existing_video = session.query(Video).filter(Video.id == video_id).first()
+    for column, digest in digests.items():
+        setattr(existing_video, column, digest)
+    session.commit()
+    session.close()
 
 
+def get_video_hash(video_id):
+    session = SessionLocal()
+    video = session.query(Video).filter(Video.id == video_id).first()
+    session.close()
+    return video.video_hash if video else None
 
-mesh_path = '/content/drive/MyDrive/4D-Humans/outputs'
 
 @app.route('/mesh_processor')
-def run_hmr2_model(video_id):
-
-    json_file_path = "/content/drive/MyDrive/4D-Humans/website/output/walking_man.json"
-    json_file_preprocessed_path="/content/drive/MyDrive/4D-Humans/website/output/walking_man_preprocessed.json"
-    try:
-        clear_json()
+def run_hmr2_model(video_id, workspace, report=None):
 
-        # Data is saved to a temporary file
-        temp_video_path = '/temp_video.mp4' 
-        video_data = retrieve_video_from_db(video_id, temp_video_path)
+    def track():
+        # Data is saved to the job's workspace
+        video_source = retrieve_video_from_db(video_id, workspace.video_path)
 
-        # Call the track method of the HMR 2.0 mesh recovery model
-        command = ['python', '/content/drive/MyDrive/4D-Humans/track.py', f'video.source={temp_video_path}']
-        subprocess.run(command, check=True)  # Run the track function through a subprocess
+        # Run the resident HMR 2.0 tracker on the video
+        tracking = tracking_service.track(video_source, workspace.tracking_dir, frame_store=workspace.smpl_frames)
         print("Tracking completed successfully.")
+        release_decoded_frames(video_id)
 
-        result_file_path = os.path.join(mesh_path, f"PHALP_temp_video.mp4")  # Result file path
-        animation_output_path = '/content/drive/MyDrive/4D-Humans/website/outputs/walkingman_animation.mp4'
-        if os.path.exists(result_file_path):
-            print(f"Results saved at: {result_file_path}")
-            
-            session = SessionLocal()
-            existing_video = session.query(Video).filter(Video.id == video_id).first()
-
-            mesh_binary = None
-            with open(result_file_path, 'rb') as video_file:
-              mesh_binary = video_file.read()
-
-            existing_video.mesh = mesh_binary
-            session.commit()
-            session.close()
-
-            preprocessdata()
-
-            return True
-        else:
+        result_file_path = tracking.mesh_video_path  # Result file path
+        if not os.path.exists(result_file_path):
             raise FileNotFoundError("Tracking results file not found.")
+        print(f"Results saved at: {result_file_path}")
+        return result_file_path
+
+    def store_mesh(track):
+        return store_video_artifact(video_id, 'mesh_hash', track)
+
+    def preprocess(track):
+        walk = preprocessdata(workspace)
+        if walk is None:
+            raise RuntimeError("No SMPL frames were recorded during tracking.")
+        return walk
+
+    def animate(preprocess):
+        save_smpl_animation(preprocess, workspace.animation_path, sigma=1.0,
+                            num_workers=int(os.environ.get("GAIT_RENDER_WORKERS", os.cpu_count() or 1)))
+        return store_video_artifact(video_id, 'animate_hash', workspace.animation_path)
+
+    def enroll(preprocess):
+        # Enrollment, identification and, when an encoder was trained for it, the epochs and loss it stopped at
+        return results(preprocess)
+
+    # Once the walk is preprocessed, the animation renders while the walk is enrolled and identified.
+    # The preprocessed walk is not memoised, it is reloaded from the workspace when a retry needs it.
+    graph = StageGraph()
+    graph.add("track", track)
+    graph.add("store_mesh", store_mesh, deps=["track"])
+    graph.add("preprocess", preprocess, deps=["track"], persist=False)
+    graph.add("animate", animate, deps=["preprocess"])
+    graph.add("enroll", enroll, deps=["preprocess"])
+
+    stage_results = graph.run(StageMemo(workspace.stage_memo), max_workers=int(os.environ.get("GAIT_STAGE_WORKERS", 2)))
+    if report is not None:
+        report.update(stage_results["enroll"])
+        report["mesh_hash"] = stage_results["store_mesh"]
+        report["animate_hash"] = stage_results["animate"]
+    return True
+
+def analyse_video(job_id, video_id):
+    # Every job works in its own directory, kept after a failure so that the retry resumes from it
+    report = {"video_id": video_id}
+    video_hash = get_video_hash(video_id)
+
+    cached = result_cache.get(video_hash) if video_hash else None
+    if cached is not None:
+        # The same video was analysed before: reuse its artifacts and result
+        print(f"Video {video_id} was analysed before, using the cached results.")
+        set_video_artifacts(video_id, mesh_hash=cached["mesh_hash"], animate_hash=cached["animate_hash"])
+        release_decoded_frames(video_id)
+        report.update(cached["result"] or {})
+        report.update(video_id=video_id, cached=True)
+        return report
 
-    except Exception as e:
-        print(f"Error: {e}")
-
+    try:
+        with app.app_context(), JobWorkspace(job_id) as workspace:
+            if not run_hmr2_model(video_id, workspace, report):
+                raise RuntimeError(f"Analysis of video {video_id} failed")
+            if video_hash:
+                result_cache.put(video_hash, result={k: v for k, v in report.items() if k != "video_id"},
+                                 mesh_hash=report["mesh_hash"], animate_hash=report["animate_hash"])
     finally:
-        preprocessdata() 
-        save_smpl_animation(json_file_preprocessed_path,animation_output_path , sigma=1.0)
-        results()
-        get_identification_results()
-        
-    return False  
+        preprocess_cache.discard(job_id)
+    return report
+
+def publish_job_status(job):
+    if job["state"] == JOB_FAILED:
+        # No retry left to resume from the workspace
+        JobWorkspace(job["id"]).cleanup()
+    # Only the owner of the video is told about the job
+    session = SessionLocal()
+    try:
+        video = session.query(Video).filter(Video.id == job["video_id"]).first()
+    finally:
+        session.close()
+    if video is not None:
+        socketio.emit("job_status", job, to=user_room(video.user_id))
+
+# Durable analysis queue; the pool size bounds how many videos are processed at once
+job_queue = JobQueue(engine, analyse_video, num_workers=int(os.environ.get("GAIT_JOB_WORKERS", 1)),
+                     max_attempts=int(os.environ.get("GAIT_JOB_MAX_ATTEMPTS", 3)), on_update=publish_job_status)
+job_queue.start()
 
 @app.route('/get_identification_results', methods=['GET'])
 def get_identification_results():
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+BLOB_ROOT = "/content/drive/MyDrive/4D-Humans/website/blobs"
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """
+    Content-addressed file store. Every blob is saved once under <root>/<aa>/<bb>/<sha256>, where aa and bb are
+    the first characters of its SHA-256, and is referred to by that hash.
+    """
+
+    def __init__(self, root=BLOB_ROOT):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return digest is not None and os.path.exists(self.path(digest))
+
+    def put_stream(self, stream, chunk_size=CHUNK_SIZE):
+        """
+        Copy a file-like object into the store chunk by chunk, hashing it on the way.
+        Returns the (sha256, size) of the blob.
+        """
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            digest = sha256.hexdigest()
+            self._commit(tmp_path, digest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest, size
+
+    def put_file(self, file_path):
+        with open(file_path, "rb") as f:
+            return self.put_stream(f)
+
+    def adopt(self, file_path, digest=None):
+        """
+        Move an existing file into the store instead of copying it. The file is hashed first unless its
+        SHA-256 is already known. Returns the (sha256, size) of the blob.
+        """
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+        size = os.path.getsize(file_path)
+        self._commit(file_path, digest)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return digest, size
+
+    def _commit(self, tmp_path, digest):
+        # Identical content is only stored once
+        blob_path = self.path(digest)
+        if os.path.exists(blob_path):
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(tmp_path, blob_path)
+
+    def materialize(self, digest, dest_path):
+        """Make the blob available at dest_path, as a hard link when possible and as a copy otherwise."""
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(self.path(digest), dest_path)
+        except OSError:
+            shutil.copyfile(self.path(digest), dest_path)
+        return dest_path
+
+    def delete(self, digest):
+        if self.exists(digest):
+            os.remove(self.path(digest))
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+UPLOAD_ROOT = "/content/drive/MyDrive/4D-Humans/website/uploads"
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_IDLE = 24 * 3600  # Seconds without a chunk after which an upload is abandoned
+UPLOAD_SWEEP_INTERVAL = 3600
+FINISHED_UPLOAD_TTL = 3600  # Seconds a finished upload still answers clients that lost the last response
+
+
+class UploadOffsetError(Exception):
+    """Raised when a chunk does not start where the upload currently ends."""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class PrefixDecoder(threading.Thread):
+    """
+    Decode frames of a video that is still being uploaded.
+
+    The part file is fed to ffmpeg through a pipe as it grows, so frames of the completed prefix are extracted
+    while the rest of the file is in transit. This only succeeds for videos that can be decoded front to back
+    (fast-start or fragmented MP4); for others ffmpeg fails and the tracker extracts the frames itself later.
+    """
+
+    def __init__(self, part_path, frames_dir):
+        super().__init__(name="prefix-decoder", daemon=True)
+        self.part_path = part_path
+        self.frames_dir = frames_dir
+        self.available = 0
+        self.complete = False
+        self.succeeded = False
+        self._changed = threading.Condition()
+        os.makedirs(frames_dir, exist_ok=True)
+
+    def notify(self, available, complete=False):
+        with self._changed:
+            self.available = available
+            self.complete = complete
+            self._changed.notify()
+
+    def run(self):
+        # Same frame naming as PHALP's own extraction
+        command = ["ffmpeg", "-loglevel", "error", "-y", "-i", "pipe:0", "-q:v", "2", "-start_number", "1",
+                   os.path.join(self.frames_dir, "%06d.jpg")]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        position = 0
+        try:
+            with open(self.part_path, "rb") as f:
+                while True:
+                    with self._changed:
+                        while position >= self.available and not self.complete:
+                            self._changed.wait()
+                        available, complete = self.available, self.complete
+                    if position >= available and complete:
+                        break
+                    f.seek(position)
+                    chunk = f.read(min(available - position, CHUNK_SIZE))
+                    position += len(chunk)
+                    process.stdin.write(chunk)
+        except (BrokenPipeError, OSError) as e:
+            print(f"Prefix decoding stopped: {e}")
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            self.succeeded = process.wait() == 0 and position == self.available
+
+    def finish(self):
+        """Wait for the remaining frames, returns whether the whole video was decoded."""
+        self.notify(self.available, complete=True)
+        self.join()
+        return self.succeeded and len(os.listdir(self.frames_dir)) > 0
+
+
+class UploadSession:
+    def __init__(self, upload_id, user_id, filename, size, root):
+        self.id = upload_id
+        self.user_id = user_id
+        self.filename = filename
+        self.size = size
+        self.dir = os.path.join(root, upload_id)
+        self.lock = threading.Lock()
+        self.sha256 = hashlib.sha256()  # Running hash, lost if the server restarts mid-upload
+        self.hashed = 0
+        self.decoder = None
+
+    @property
+    def part_path(self):
+        return os.path.join(self.dir, "video.part")
+
+    @property
+    def frames_dir(self):
+        return os.path.join(self.dir, "frames")
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.dir, "upload.json")
+
+    @property
+    def last_activity(self):
+        """Time of the last chunk, or of the creation of the upload."""
+        return max(os.path.getmtime(path) for path in (self.part_path, self.meta_path) if os.path.exists(path))
+
+    @property
+    def offset(self):
+        return os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+
+    def save(self):
+        with open(self.meta_path, "w") as f:
+            json.dump({"user_id": self.user_id, "filename": self.filename, "size": self.size}, f)
+
+    def to_dict(self):
+        return {"upload_id": self.id, "offset": self.offset, "size": self.size}
+
+
+class UploadManager:
+    """
+    Resumable chunked uploads. Chunks are appended to a part file on disk at the offset the client sends;
+    the upload can be resumed after a dropped connection (or a server restart) from the offset reported by get().
+    Uploads that receive no chunk for max_idle seconds are abandoned: once started, a background thread
+    discards them every sweep_interval seconds, with their decoder and part file.
+    """
+
+    def __init__(self, blob_store, root=UPLOAD_ROOT, decode_frames=True, max_idle=UPLOAD_MAX_IDLE,
+                 sweep_interval=UPLOAD_SWEEP_INTERVAL):
+        self.blob_store = blob_store
+        self.root = root
+        self.decode_frames = decode_frames and shutil.which("ffmpeg") is not None
+        self.max_idle = max_idle
+        self.sweep_interval = sweep_interval
+        self._sessions = {}
+        self._finished = {}  # upload_id -> (user_id, result, finish time) of recently finished uploads
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._sweeper = None
+        os.makedirs(root, exist_ok=True)
+
+    def start(self):
+        self._sweeper = threading.Thread(target=self._sweep, name="upload-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def _sweep(self):
+        while not self._stopping.is_set():
+            try:
+                self.expire()
+            except Exception as e:
+                print(f"Upload sweep failed: {e}")
+            self._stopping.wait(self.sweep_interval)
+
+    def expire(self):
+        """Discard the uploads that received no chunk for max_idle seconds, returns how many were discarded."""
+        with self._lock:
+            for upload_id in [upload_id for upload_id, (_, _, finished_at) in self._finished.items()
+                              if finished_at < time.time() - FINISHED_UPLOAD_TTL]:
+                del self._finished[upload_id]
+
+        cutoff = time.time() - self.max_idle
+        expired = 0
+        for upload_id in os.listdir(self.root):
+            # Finalized uploads have no upload.json, their directory only holds the frames of a stored video
+            if not os.path.exists(os.path.join(self.root, upload_id, "upload.json")):
+                continue
+            session = self.get(upload_id)
+            if session is None:
+                continue
+            # Skip uploads receiving a chunk right now
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                try:
+                    if session.last_activity > cutoff:
+                        continue
+                except (OSError, ValueError):
+                    continue  # Finalized or discarded meanwhile
+                self.discard(session)
+                expired += 1
+            finally:
+                session.lock.release()
+        if expired:
+            print(f"Discarded {expired} abandoned uploads")
+        return expired
+
+    def create(self, user_id, filename, size):
+        session = UploadSession(uuid.uuid4().hex, user_id, filename, size, self.root)
+        os.makedirs(session.dir)
+        open(session.part_path, "wb").close()
+        session.save()
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                meta_path = os.path.join(self.root, os.path.basename(upload_id), "upload.json")
+                if not os.path.exists(meta_path):
+                    return None
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                session = UploadSession(os.path.basename(upload_id), meta["user_id"], meta["filename"], meta["size"], self.root)
+                session.sha256 = None
+                self._sessions[session.id] = session
+            return session
+
+    def append(self, session, offset, stream):
+        """Write a chunk starting at offset, returns the new offset of the upload."""
+        with session.lock:
+            if offset != session.offset:
+                raise UploadOffsetError(session.offset)
+            if self.decode_frames and session.decoder is None and offset == 0:
+                session.decoder = PrefixDecoder(session.part_path, session.frames_dir)
+                session.decoder.start()
+
+            with open(session.part_path, "ab") as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if offset + len(chunk) > session.size:
+                        chunk = chunk[:session.size - offset]
+                    f.write(chunk)
+                    offset += len(chunk)
+                    if session.sha256 is not None:
+                        session.sha256.update(chunk)
+                    if offset >= session.size:
+                        break
+
+            if session.decoder is not None:
+                session.decoder.notify(offset)
+            return offset
+
+    def finalize(self, session):
+        """
+        Move the completed upload to the blob store.
+        Returns (sha256, size, frames_dir), where frames_dir holds the frames decoded during the upload or is
+        None if they could not be decoded.
+        """
+        with session.lock:
+            if session.offset != session.size:
+                raise UploadOffsetError(session.offset)
+            frames_dir = None
+            if session.decoder is not None and session.decoder.finish():
+                frames_dir = session.frames_dir
+            digest = session.sha256.hexdigest() if session.sha256 is not None else None
+            digest, size = self.blob_store.adopt(session.part_path, digest)
+            os.remove(session.meta_path)
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        if frames_dir is None:
+            shutil.rmtree(session.dir, ignore_errors=True)
+        return digest, size, frames_dir
+
+    def complete(self, session, result):
+        """
+        Remember the result of a finalized upload, e.g. its video and job, for FINISHED_UPLOAD_TTL seconds, so
+        that a client whose response to the last chunk was lost can still get it.
+        """
+        with self._lock:
+            self._finished[session.id] = (session.user_id, result, time.time())
+
+    def finished(self, upload_id):
+        """(user_id, result) of a recently finished upload, or None."""
+        with self._lock:
+            entry = self._finished.get(upload_id)
+        if entry is None or entry[2] < time.time() - FINISHED_UPLOAD_TTL:
+            return None
+        return entry[0], entry[1]
+
+    def discard(self, session):
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        if session.decoder is not None:
+            session.decoder.finish()
+        shutil.rmtree(session.dir, ignore_errors=True)
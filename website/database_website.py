@@ -1,6 +1,6 @@
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from db import USERS_DATABASE_URL, get_engine, get_scoped_session
 
 # Define the base class for the model
 Base = declarative_base()
@@ -16,11 +16,11 @@ class User(Base):
     password = Column(String, nullable=False)
 
 # Create SQLite database 
-DATABASE_URL = "sqlite:///users.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = USERS_DATABASE_URL
+engine = get_engine(DATABASE_URL)
 
 # Create the table in the database
 Base.metadata.create_all(engine)
 
 # Create a session to interact with the database
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = get_scoped_session(DATABASE_URL)
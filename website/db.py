@@ -0,0 +1,83 @@
+import os
+import threading
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+USERS_DATABASE_URL = "sqlite:///users.db"
+GAIT_DATABASE_URL = "sqlite:///gait_recognition.db"
+
+# GAIT_SQL_ECHO=1 logs every statement, for debugging only
+SQL_ECHO = os.environ.get("GAIT_SQL_ECHO", "0") == "1"
+# Write-ahead logging lets readers proceed while a job writes; disable it on filesystems without shared memory
+SQLITE_WAL = os.environ.get("GAIT_SQLITE_WAL", "1") == "1"
+POOL_SIZE = int(os.environ.get("GAIT_DB_POOL_SIZE", 8))
+MAX_OVERFLOW = int(os.environ.get("GAIT_DB_MAX_OVERFLOW", 8))
+BUSY_TIMEOUT = 30  # Seconds a connection waits for a lock held by another writer
+
+_engines = {}
+_sessions = {}
+_lock = threading.RLock()
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints; a power loss can only drop the last transactions, never corrupt the file
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+    cursor.close()
+
+
+def get_engine(url):
+    """The one engine of a database, shared by every module of the website."""
+    with _lock:
+        if url not in _engines:
+            engine = create_engine(
+                url,
+                echo=SQL_ECHO,
+                poolclass=QueuePool,
+                pool_size=POOL_SIZE,
+                max_overflow=MAX_OVERFLOW,
+                pool_pre_ping=True,
+                connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT},
+            )
+            if url.startswith("sqlite"):
+                event.listen(engine, "connect", _configure_sqlite)
+            _engines[url] = engine
+        return _engines[url]
+
+
+def get_scoped_session(url):
+    """
+    Thread-local session factory of a database: every request or job thread gets its own session, released by
+    remove() at the end of the request or job.
+    """
+    with _lock:
+        if url not in _sessions:
+            _sessions[url] = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=get_engine(url)))
+        return _sessions[url]
+
+
+def remove_sessions():
+    """Release the sessions of the current thread, for every database."""
+    for session in list(_sessions.values()):
+        session.remove()
+
+
+# create_all does not alter existing tables, so add columns introduced since the table was created
+def add_missing_columns(engine, table):
+    existing_columns = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    with engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+# Likewise for indexes on existing tables
+def add_missing_indexes(engine, table):
+    for table_index in table.indexes:
+        table_index.create(engine, checkfirst=True)
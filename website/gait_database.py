@@ -1,103 +1,344 @@
-from sqlalchemy import create_engine, Column, Integer, LargeBinary
+from sqlalchemy import Column, Float, Integer, LargeBinary, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import numpy as np
-from scipy.spatial.distance import cosine
+import hashlib
+import os
+from gait_gallery import GaitGallery
+from gait_index import GaitIndex, INDEX_PATH
+from gait_templates import PersonTemplates, search_templates
+from db import GAIT_DATABASE_URL, add_missing_columns, add_missing_indexes, get_engine
+from gait_embedding import (EMBEDDING_DIM, EMBEDDING_DTYPES, dequantize_embedding, fit_standardization,
+                            pool_gait_signature, quantize_embedding)
 
 
 Base = declarative_base()
-DATABASE_URL = 'sqlite:///gait_recognition.db'
+DATABASE_URL = GAIT_DATABASE_URL
 
 class GaitData(Base):
     __tablename__ = 'gait_data'
     gait_id = Column(Integer, primary_key=True, autoincrement=True)
-    person_id = Column(Integer)  # Unique ID for identified individuals
-    gait_signature = Column(LargeBinary, nullable=False)
-
-
-engine = create_engine(DATABASE_URL, echo=True)
+    person_id = Column(Integer, index=True)  # Unique ID for identified individuals
+    gait_signature = Column(LargeBinary, nullable=False)  # Per-frame codes, float32
+    content_hash = Column(String(64), index=True, nullable=True)  # SHA-256 of gait_signature, for duplicate detection
+    embedding = Column(LargeBinary, nullable=True)  # Fixed-length pooled descriptor, stored as embedding_dtype
+    embedding_dtype = Column(String(8), nullable=True)  # float32 (or NULL), float16 or int8
+    embedding_scale = Column(Float, nullable=True)  # Per-vector scale of int8 embeddings
+    encoder_version = Column(Integer, nullable=True)  # Registered gait encoder that produced the codes
+    features_path = Column(String, nullable=True)  # Input features of the walk, for re-embedding
+
+class PersonTemplate(Base):
+    __tablename__ = 'person_templates'
+    person_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)  # Number of gait entries summarised
+    mean = Column(LargeBinary, nullable=False)  # Running mean of the normalised embeddings, float32
+    m2 = Column(LargeBinary, nullable=False)  # Running sum of squared deviations (covariance * (count - 1)), float32
+
+class EmbeddingStats(Base):
+    __tablename__ = 'embedding_stats'
+    id = Column(Integer, primary_key=True)  # Single row, id 1
+    size = Column(Integer, nullable=False)  # Number of gait entries the statistics were fitted on
+    center = Column(LargeBinary, nullable=False)  # Per-dimension mean of the embeddings, float32
+    scale = Column(LargeBinary, nullable=False)  # Per-dimension standard deviation of the embeddings, float32
+
+class GalleryState(Base):
+    __tablename__ = 'gallery_state'
+    id = Column(Integer, primary_key=True)  # Single row, id 1
+    encoder_version = Column(Integer, nullable=True)  # Encoder the stored embeddings were made with
+    revision = Column(Integer, nullable=False, default=0)  # Bumped when the embeddings or their statistics are rewritten
+
+
+engine = get_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 
 Base.metadata.create_all(engine)
 
+# create_all does not alter existing tables, so add columns and indexes introduced since they were created
+add_missing_columns(engine, GaitData.__table__)
+add_missing_indexes(engine, GaitData.__table__)
+
+
+def content_hash(gait_signature):
+    return hashlib.sha256(np.asarray(gait_signature, dtype=np.float32).tobytes()).hexdigest()
+
+
+# Entries stored before content hashes existed are hashed once
+def backfill_content_hashes():
+    session = Session()
+    try:
+        entries = session.query(GaitData).filter(GaitData.content_hash.is_(None)).all()
+        for entry in entries:
+            entry.content_hash = content_hash(np.frombuffer(entry.gait_signature, dtype=np.float32))
+        session.commit()
+    finally:
+        session.close()
+
+backfill_content_hashes()
+
+# Storage format of new embeddings, see gait_embedding.EMBEDDING_DTYPES
+EMBEDDING_DTYPE = os.environ.get("GAIT_EMBEDDING_DTYPE", "float32")
+if EMBEDDING_DTYPE not in EMBEDDING_DTYPES:
+    raise ValueError(f"GAIT_EMBEDDING_DTYPE must be one of {EMBEDDING_DTYPES}")
+
+
+def stored_embedding(embedding_blob, gait_signature_blob, embedding_dtype=None, embedding_scale=None):
+    # Entries stored before embeddings existed are pooled from their codes, which are not in temporal order
+    if embedding_blob is not None:
+        return dequantize_embedding(embedding_blob, embedding_dtype, embedding_scale)
+    return pool_gait_signature(np.frombuffer(gait_signature_blob, dtype=np.float32), cycle_aligned=False)
+
+# In-memory copy of every gait embedding, loaded on first use and kept in sync by insert_gait_signature
+gallery = GaitGallery()
+
+# Approximate nearest neighbour index over the gallery, saved next to the database.
+# GAIT_INDEX_NPROBE trades recall for latency (more clusters scanned per query).
+index = GaitIndex(INDEX_PATH, nprobe=int(os.environ.get("GAIT_INDEX_NPROBE", 4)))
+
+# Per-person templates over the gallery rows, persisted in person_templates and updated on every insert.
+# GAIT_TEMPLATE_RERANK persons per requested match are shortlisted by template, 0 disables templates.
+templates = PersonTemplates()
+TEMPLATE_RERANK = int(os.environ.get("GAIT_TEMPLATE_RERANK", 4))
+
+# The gallery standardises embeddings per dimension with statistics of the stored ones, persisted in
+# embedding_stats. They are refitted when the gallery has grown GAIT_STANDARDIZATION_REFIT times since.
+STANDARDIZATION_REFIT = float(os.environ.get("GAIT_STANDARDIZATION_REFIT", 2))
+# Statistics of a handful of entries are degenerate: with two, every dimension standardises to +1 and -1 and
+# the two walks score -1 whatever they are. Smaller galleries are scored on the raw embeddings.
+MIN_STANDARDIZATION_SIZE = 50
+
+# Minimum similarity of a standardised probe to the best other person for an identification
+IDENTIFICATION_THRESHOLD = float(os.environ.get("GAIT_IDENTIFICATION_THRESHOLD", 0.8))
+
+def save_templates(session, person_ids):
+    with templates.lock:
+        for person_id in person_ids:
+            row = templates.rows[person_id]
+            session.merge(PersonTemplate(person_id=person_id, count=int(templates.counts[row]),
+                                         mean=templates.means[row].tobytes(), m2=templates.m2[row].tobytes()))
+    session.commit()
+
+def load_templates(session, rebuild=False):
+    with gallery.lock, templates.lock:
+        stored = session.query(PersonTemplate).all()
+        # Stored templates are only used when they cover exactly the gallery's persons and enrollments
+        enrollments = {person_id: len(rows) for person_id, rows in gallery.rows_by_person.items()}
+        if not rebuild and {t.person_id: t.count for t in stored} == enrollments \
+                and all(len(t.mean) == 4 * gallery.dim for t in stored):
+            templates.clear()
+            for t in stored:
+                templates.set(t.person_id, t.count, np.frombuffer(t.mean, dtype=np.float32),
+                              np.frombuffer(t.m2, dtype=np.float32))
+        else:
+            templates.rebuild(gallery)
+            session.query(PersonTemplate).delete()
+            save_templates(session, templates.person_ids.tolist())
+
+def load_standardization(session, embeddings, refit=False):
+    """
+    (center, scale, size, refitted): the stored standardisation statistics, fitted on size entries, or new ones
+    fitted on the embeddings when there are none, they are stale or refit is set. center and scale are None
+    while there are fewer than MIN_STANDARDIZATION_SIZE embeddings.
+    """
+    stored = session.query(EmbeddingStats).get(1)
+    if stored is not None and not refit and len(stored.center) == 4 * EMBEDDING_DIM \
+            and stored.size >= MIN_STANDARDIZATION_SIZE \
+            and len(embeddings) < STANDARDIZATION_REFIT * stored.size:
+        return np.frombuffer(stored.center, dtype=np.float32), np.frombuffer(stored.scale, dtype=np.float32), \
+            stored.size, False
+
+    fitted = [embedding for embedding in embeddings if len(embedding) == EMBEDDING_DIM]
+    if len(fitted) < MIN_STANDARDIZATION_SIZE:
+        session.query(EmbeddingStats).delete()
+        session.commit()
+        return None, None, 0, stored is not None or refit
+    center, scale = fit_standardization(fitted)
+    session.merge(EmbeddingStats(id=1, size=len(embeddings), center=center.tobytes(), scale=scale.tobytes()))
+    session.commit()
+    return center, scale, len(embeddings), True
+
+# Revision of gallery_state the in-memory gallery, templates and index were built at
+loaded_revision = None
+
+def get_gallery_state(session):
+    return session.query(GalleryState).get(1) or GalleryState(id=1, encoder_version=None, revision=0)
+
+def bump_gallery_revision(session, encoder_version=None):
+    state = get_gallery_state(session)
+    state.revision += 1
+    if encoder_version is not None:
+        state.encoder_version = encoder_version
+    session.merge(state)
+    session.commit()
+    return state.revision
+
+def get_encoder_version():
+    """Encoder version the stored embeddings were made with, None until one is recorded."""
+    session = Session()
+    try:
+        return get_gallery_state(session).encoder_version
+    finally:
+        session.close()
 
-# Method makes the shorter feature vector to the same length as the longer
-def pad_and_flatten(gait_signature, max_length):
-    gait_signature = np.array(gait_signature)
-    
-    # Check if the signature is 1D and reshape accordingly
-    if gait_signature.ndim == 1:
-        num_features = 4  
-        num_frames = gait_signature.shape[0] // num_features
-        gait_signature = gait_signature.reshape(num_frames, num_features)
-    
-    # Pad the signature to the desired max_length
-    padded_signature = np.pad(gait_signature, ((0, max_length - gait_signature.shape[0]), (0, 0)), mode='constant')
-    
-    return padded_signature.flatten()
-
-
-# Function which performs the Cosine Similarity Algorithm
-def similarity_check(gait_signature_1, gait_signature_2):
-    max_length = max(len(gait_signature_1), len(gait_signature_2))
-    
-    flattened_1 = pad_and_flatten(gait_signature_1, max_length)
-    flattened_2 = pad_and_flatten(gait_signature_2, max_length)
-    
-    return 1 - cosine(flattened_1, flattened_2)
-
-
-def insert_gait_signature(gait_signature):
+def get_gallery(session, rebuild_templates=False, refit_standardization=False):
+    global loaded_revision
+    with gallery.lock:
+        revision = get_gallery_state(session).revision
+        if gallery.loaded and revision != loaded_revision:
+            # Another process, e.g. the offline re-embedding, rewrote the stored embeddings: the in-memory
+            # gallery, templates and clusters are stale and must not be saved over the rebuilt ones
+            print("Stored gait embeddings changed, reloading the gallery.")
+            gallery.loaded = False
+            rebuild_templates = refit_standardization = True
+        if not gallery.loaded:
+            entries = session.query(GaitData.gait_id, GaitData.person_id, GaitData.embedding, GaitData.gait_signature,
+                                    GaitData.embedding_dtype, GaitData.embedding_scale).all()
+            entries = [(gait_id, person_id, stored_embedding(embedding, signature, dtype, scale))
+                       for gait_id, person_id, embedding, signature, dtype, scale in entries]
+            center, scale, size, refitted = load_standardization(session, [entry[2] for entry in entries],
+                                                                 refit_standardization)
+            if refitted:
+                revision = bump_gallery_revision(session)
+            gallery.load(entries, center, scale, size)
+            index.load(gallery)
+            if refitted and index.trained:
+                # The clusters were trained on vectors standardised differently
+                index.train(gallery)
+                index.save(gallery)
+            load_templates(session, rebuild_templates or refitted)
+            loaded_revision = revision
+    return gallery
+
+def search_gallery(session, probe, k=1, exclude_person_id=None):
+    """Best matching persons: shortlisted by template and re-ranked on their samples, or through the index."""
+    gallery = get_gallery(session)
+    if TEMPLATE_RERANK > 0 and len(templates):
+        return search_templates(gallery, templates, probe, k, TEMPLATE_RERANK, exclude_person_id)
+    return index.search(gallery, probe, k, exclude_person_id=exclude_person_id)
+
+
+def reload_gallery(session):
+    with gallery.lock:
+        gallery.loaded = False
+        # The stored vectors changed: refitting the standardisation retrains the clusters and rebuilds the templates
+        get_gallery(session, rebuild_templates=True, refit_standardization=True)
+
+
+def insert_gait_signature(gait_signature, embedding=None, save_features=None, encoder_version=None):
+    """
+    Enroll a walk, returns its person_id. save_features, if given, is called only when a new entry is
+    inserted and returns the path of the walk's features, so that duplicates leave nothing behind.
+    """
     session = Session()
+    features_path = None
+    committed = False
     try:
-        existing_entries = session.query(GaitData).all()
-        matching_entry = None
+        gallery = get_gallery(session)
         highest_similarity = 0
 
         gait_signature_np = np.frombuffer(gait_signature, dtype=np.float32)  # Convert to NumPy array
+        if embedding is None:
+            embedding = pool_gait_signature(gait_signature_np, cycle_aligned=False)
+        embedding_np = np.asarray(embedding, dtype=np.float32).ravel()
 
-        for entry in existing_entries:
-            stored_gait_np = np.frombuffer(entry.gait_signature, dtype=np.float32)  # Convert from binary
-            current_similarity = similarity_check(gait_signature_np, stored_gait_np)
+        # Exact duplicates are found through the indexed content hash
+        signature_hash = content_hash(gait_signature_np)
+        existing_gait = session.query(GaitData.person_id).filter(GaitData.content_hash == signature_hash).first()
+        if existing_gait:
+            print("Gait signature already exists, skipping insert.")
+            return existing_gait.person_id
 
-            if current_similarity == 1:  # Exact match found
-                print("Duplicate gait signature found. Skipping insert.")
-                return entry.person_id  # Return existing person_id
+        # Compare the fixed-length embedding with the stored ones
+        matches = index.search(gallery, embedding_np, k=1)
+        if matches and matches[0].score > highest_similarity:
+            matching_entry = matches[0]
+            highest_similarity = matching_entry.score
 
-            if current_similarity > highest_similarity:
-                matching_entry = entry
-                highest_similarity = current_similarity
+            if highest_similarity >= 1 - 1e-6:  # Exact match found
+                print("Duplicate gait signature found. Skipping insert.")
+                return matching_entry.person_id  # Return existing person_id
         print("similarity found: ",highest_similarity)
 
         
         if highest_similarity > 1:
             person_id = matching_entry.person_id 
         else:
-            people = {entry.person_id for entry in existing_entries}  # Set of existing person_ids
-            person_id = max(people, default=0) + 1  # Assign a new person_id
+            people = gallery.person_ids[:len(gallery)]  # Existing person_ids
+            person_id = int(people.max(initial=0)) + 1  # Assign a new person_id
 
         gait_signature_blob = gait_signature_np.tobytes()  # Convert back to bytes
 
-        # Final check before inserting
-        existing_gait = session.query(GaitData).filter(GaitData.gait_signature == gait_signature_blob).first()
-        if existing_gait:
-            print("Gait signature already exists, skipping insert.")
-            return existing_gait.person_id  
-
         # Insert new gait signature
-        new_gait = GaitData(person_id=person_id, gait_signature=gait_signature_blob)
+        if save_features is not None:
+            features_path = save_features()
+        embedding_blob, embedding_scale = quantize_embedding(embedding_np, EMBEDDING_DTYPE)
+        new_gait = GaitData(person_id=person_id, gait_signature=gait_signature_blob, content_hash=signature_hash,
+                            embedding=embedding_blob, embedding_dtype=EMBEDDING_DTYPE, embedding_scale=embedding_scale,
+                            encoder_version=encoder_version, features_path=features_path)
         session.add(new_gait)
+        state = get_gallery_state(session)
+        if encoder_version is not None and state.encoder_version is None:
+            # The first walk embedded by a registered encoder fixes the version later walks are embedded with
+            state.encoder_version = encoder_version
+            session.merge(state)
         session.commit()
+        committed = True
+        # The gallery holds the stored (possibly quantised) values, as it would after a reload
+        gallery.add(new_gait.gait_id, person_id, dequantize_embedding(embedding_blob, EMBEDDING_DTYPE, embedding_scale))
+        if templates.dim == gallery.dim:
+            templates.update(person_id, gallery.matrix[len(gallery) - 1])
+            save_templates(session, [person_id])
+        else:
+            # The gallery was widened for a longer signature
+            load_templates(session, rebuild=True)
+        index.sync(gallery)
+        index.save(gallery)
+        if len(gallery) >= max(STANDARDIZATION_REFIT * gallery.standardized_size, MIN_STANDARDIZATION_SIZE):
+            # The gallery outgrew the statistics it is standardised with
+            reload_gallery(session)
         
         return person_id
 
     except Exception as e:
         session.rollback()
+        if features_path is not None and not committed and os.path.exists(features_path):
+            os.remove(features_path)
         print(f"Error inserting/updating gait signature: {e}")
         return None
     finally:
         session.close()
 
+def get_stale_gait_entries(encoder_version):
+    """(gait_id, features_path) of the entries made by another encoder whose features are still available."""
+    session = Session()
+    try:
+        entries = session.query(GaitData.gait_id, GaitData.features_path).filter(
+            GaitData.features_path.isnot(None),
+            (GaitData.encoder_version != encoder_version) | GaitData.encoder_version.is_(None)).all()
+        return [(gait_id, path) for gait_id, path in entries if os.path.exists(path)]
+    finally:
+        session.close()
+
+def update_gait_embeddings(updates, encoder_version):
+    """Replace the codes and embeddings of many entries at once; updates holds (gait_id, codes, embedding)."""
+    session = Session()
+    try:
+        for gait_id, gait_codes, embedding in updates:
+            entry = session.query(GaitData).get(gait_id)
+            entry.gait_signature = np.asarray(gait_codes, dtype=np.float32).tobytes()
+            entry.content_hash = content_hash(gait_codes)
+            entry.embedding, entry.embedding_scale = quantize_embedding(embedding, EMBEDDING_DTYPE)
+            entry.embedding_dtype = EMBEDDING_DTYPE
+            entry.encoder_version = encoder_version
+        session.commit()
+        # Processes holding the old embeddings in memory reload them on their next get_gallery
+        bump_gallery_revision(session, encoder_version)
+        reload_gallery(session)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 def get_most_recent_person_id():
     session = Session()
     try:
@@ -137,48 +378,83 @@ def get_gait_signature_from_last_person():
         session.close()
 
 
-def human_identification():
+def identify_batch(probes, k=1, exclude_person_ids=None):
+    """
+    Identify many walks at once: probes is an (M, D) matrix of embeddings. Returns (person_ids, gait_ids, scores),
+    each (M, k), with the k best matching persons of every probe, best first; person_id -1 and score NaN
+    where there are no more persons to match.
+    """
     session = Session()
     try:
-        # Get the latest person id and their gait signature
-        last_entry = session.query(GaitData).order_by(GaitData.person_id.desc()).first()
+        return get_gallery(session).top_k_batch(probes, k, exclude_person_ids)
+    finally:
+        session.close()
 
-        if last_entry is None:
-            print("Result: No gait signature found in the database.")
-            return None
 
-        highest_person_id = last_entry.person_id  # Latest person ID
-        highest_person_gait_signature = np.frombuffer(last_entry.gait_signature, dtype=np.float32)
+def reidentify_gallery(k=1):
+    """
+    Match every stored entry against the persons other than its own, e.g. for a nightly re-identification.
+    Returns (gait_ids, person_ids, matched person_ids, matched gait_ids, scores). With fewer than k other
+    persons, the remaining matches are person_id -1 and score NaN.
+    """
+    session = Session()
+    try:
+        gallery = get_gallery(session)
+        with gallery.lock:
+            gait_ids = gallery.gait_ids[:len(gallery)].copy()
+            person_ids = gallery.person_ids[:len(gallery)].copy()
+            probes = gallery.matrix[:len(gallery)].copy()
+        matched_persons, matched_gait_ids, scores = gallery.top_k_batch(probes, k, exclude_person_ids=person_ids,
+                                                                        fitted=True)
+        return gait_ids, person_ids, matched_persons, matched_gait_ids, scores
+    finally:
+        session.close()
+
 
-        existing_entries = session.query(GaitData).filter(GaitData.person_id != highest_person_id).all()
+def identify_walk(embedding, exclude_person_id=None):
+    """
+    Identification message of a walk's embedding: its best match among the persons other than
+    exclude_person_id, usually the person the walk was enrolled as. None when there is nobody else to compare
+    with; errors are raised.
+    """
+    session = Session()
+    try:
+        matches = search_gallery(session, embedding, k=1, exclude_person_id=exclude_person_id)
 
-        if not existing_entries:
+        if not matches:
             print("Result: No previous gait signatures available for comparison.")
             return None
 
-        highest_similarity = 0
-        identified_person_id = None
+        highest_similarity = max(matches[0].score, 0)
+        identified_person_id = matches[0].person_id
 
-        for entry in existing_entries:
-            stored_gait_np = np.frombuffer(entry.gait_signature, dtype=np.float32)  # Convert from binary
-            current_similarity = similarity_check(highest_person_gait_signature, stored_gait_np)
+        if highest_similarity > IDENTIFICATION_THRESHOLD:
+            return f"Person identified. {identified_person_id} with similarity: {highest_similarity}"
+        else:
+            return f" No matching person found. Similarity: {highest_similarity}"
+    finally:
+        session.close()
 
-            if current_similarity > highest_similarity:
-                highest_similarity = current_similarity
-                identified_person_id = entry.person_id
 
-        if highest_similarity > 0.75:
-            return "Person identified. {identified_person_id} with similarity: {highest_similarity}"
+def human_identification():
+    session = Session()
+    try:
+        # Get the latest person id and their gait signature
+        last_entry = session.query(GaitData).order_by(GaitData.person_id.desc()).first()
+
+        if last_entry is None:
+            print("Result: No gait signature found in the database.")
+            return None
 
-            return identified_person_id  
-        else:
-            return f" No matching person found. Similarity: {highest_similarity}"
+        highest_person_id = last_entry.person_id  # Latest person ID
+        highest_person_embedding = stored_embedding(last_entry.embedding, last_entry.gait_signature,
+                                                    last_entry.embedding_dtype, last_entry.embedding_scale)
 
-            return None  # No matching person found
+        # Best match among everyone else
+        return identify_walk(highest_person_embedding, exclude_person_id=highest_person_id)
 
     except Exception as e:
         return f"Error during human identification: {e}"
-        return None
     finally:
         session.close()
 
@@ -0,0 +1,99 @@
+import numpy as np
+
+CODE_DIM = 32  # Size of the autoencoder bottleneck, i.e. of one per-frame gait code
+EMBEDDING_DIM = 2 * CODE_DIM
+
+
+def estimate_gait_period(codes, min_period=15, max_period=90, min_correlation=0.2):
+    """
+    Length in frames of one gait cycle, from the autocorrelation of the codes' main direction of variation.
+    Returns None if the walk shows no clear periodicity within [min_period, max_period].
+    """
+    codes = np.asarray(codes, dtype=np.float32)
+    if len(codes) < 2 * min_period:
+        return None
+    centered = codes - codes.mean(axis=0)
+    # Projection on the first principal component
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    signal = centered @ vt[0]
+    energy = signal @ signal
+    if energy == 0:
+        return None
+
+    max_period = min(max_period, len(signal) // 2)
+    lags = np.arange(min_period, max_period + 1)
+    correlation = np.array([signal[:-lag] @ signal[lag:] for lag in lags]) / energy
+    if len(correlation) == 0 or correlation.max() < min_correlation:
+        return None
+    return int(lags[np.argmax(correlation)])
+
+
+def pool_gait_signature(codes, cycle_aligned=True):
+    """
+    Reduce the per-frame codes of a walk, shape (T, CODE_DIM), to one fixed-size descriptor: the mean and
+    standard deviation of every code dimension.
+    With cycle_aligned, the codes must be in temporal order and are cut to a whole number of gait cycles
+    first, so that a partial cycle at the end does not bias the statistics.
+    """
+    codes = np.asarray(codes, dtype=np.float32).reshape(-1, CODE_DIM)
+    if cycle_aligned:
+        period = estimate_gait_period(codes)
+        if period is not None:
+            codes = codes[:(len(codes) // period) * period]
+    return np.concatenate([codes.mean(axis=0), codes.std(axis=0)]).astype(np.float32)
+
+
+def fit_standardization(embeddings, min_scale=1e-3):
+    """
+    Per-dimension mean and standard deviation of an (N, D) set of embeddings, for standardize_embedding.
+    Scales are floored at min_scale so that a dimension constant across the corpus does not blow up.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    center = embeddings.mean(axis=0)
+    scale = np.maximum(embeddings.std(axis=0), min_scale)
+    return center.astype(np.float32), scale.astype(np.float32)
+
+
+def standardize_embedding(embeddings, center, scale):
+    """
+    Z-score embeddings, one per row, against corpus statistics from fit_standardization.
+
+    Pooled embeddings share a large common component (the encoder's bias, and standard deviations that are all
+    positive), so the raw cosine similarity of two unrelated walks is close to 1. Centred and scaled per
+    dimension, only how a walk differs from the corpus is compared. Embeddings of another length, or without
+    statistics (center None), are returned unchanged.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if center is None or embeddings.shape[-1] != len(center):
+        return embeddings
+    return (embeddings - center) / scale
+
+
+# Storage formats of embeddings: float32 as is, float16, or int8 with one scale per vector
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+
+def quantize_embedding(embedding, dtype="float32"):
+    """Encode an embedding for storage, returns (blob, scale); scale is None except for int8."""
+    embedding = np.asarray(embedding, dtype=np.float32).ravel()
+    if dtype == "float32":
+        return embedding.tobytes(), None
+    if dtype == "float16":
+        return embedding.astype(np.float16).tobytes(), None
+    if dtype == "int8":
+        # Symmetric quantisation: the largest magnitude maps to 127
+        scale = float(np.abs(embedding).max()) / 127 if len(embedding) else 0.0
+        quantized = np.rint(embedding / scale) if scale > 0 else np.zeros_like(embedding)
+        return quantized.astype(np.int8).tobytes(), scale
+    raise ValueError(f"Unknown embedding dtype: {dtype}")
+
+
+def dequantize_embedding(blob, dtype=None, scale=None):
+    """Decode an embedding stored by quantize_embedding back to float32. dtype None means float32."""
+    if dtype in (None, "float32"):
+        return np.frombuffer(blob, dtype=np.float32)
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if dtype == "int8":
+        return np.frombuffer(blob, dtype=np.int8).astype(np.float32) * np.float32(scale)
+    raise ValueError(f"Unknown embedding dtype: {dtype}")
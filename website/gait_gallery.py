@@ -0,0 +1,184 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from gait_embedding import standardize_embedding
+
+GalleryMatch = namedtuple("GalleryMatch", ["person_id", "gait_id", "score"])
+
+
+def normalize(signature):
+    signature = np.asarray(signature, dtype=np.float32).ravel()
+    norm = np.linalg.norm(signature)
+    return signature / norm if norm > 0 else signature
+
+
+def rank_persons(scores, person_ids, gait_ids, k):
+    """
+    The k best matching persons, each with the score and gait_id of their best matching entry.
+    """
+    order = np.argsort(-scores, kind="stable")
+    # First occurrence of every person in score order is their best entry
+    _, first = np.unique(person_ids[order], return_index=True)
+    best = order[np.sort(first)][:k]
+    return [GalleryMatch(int(person_ids[i]), int(gait_ids[i]), float(scores[i])) for i in best]
+
+
+class GaitGallery:
+    """
+    All enrolled gait signatures as one L2-normalised float32 matrix, one row per gait entry.
+
+    Signatures of different lengths are zero padded to the longest one, so a probe is scored against every
+    entry with a single matrix-vector product: the cosine similarity of the two signatures after padding the
+    shorter one with zeros. Signatures and probes are first standardised with the gallery's center and scale
+    (see gait_embedding.standardize_embedding), when it has them.
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.lock = threading.RLock()
+        self.clear()
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        with self.lock:
+            self.matrix = np.zeros((self.capacity, 0), dtype=np.float32)
+            self.gait_ids = np.zeros(self.capacity, dtype=np.int64)
+            self.person_ids = np.zeros(self.capacity, dtype=np.int64)
+            self.size = 0
+            self.rows_by_person = {}  # person_id -> gallery rows of their entries
+            self.center = None
+            self.scale = None
+            self.standardized_size = 0  # Number of entries the center and scale were fitted on
+            self.loaded = False
+
+    def load(self, entries, center=None, scale=None, standardized_size=0):
+        """Rebuild the gallery from (gait_id, person_id, signature) triples, standardised with center and scale."""
+        with self.lock:
+            self.clear()
+            self.center, self.scale, self.standardized_size = center, scale, standardized_size
+            for gait_id, person_id, signature in entries:
+                self.add(gait_id, person_id, signature)
+            self.loaded = True
+
+    def add(self, gait_id, person_id, signature):
+        signature = normalize(standardize_embedding(np.asarray(signature, dtype=np.float32).ravel(),
+                                                    self.center, self.scale))
+        with self.lock:
+            # Grow the rows geometrically and the columns to the longest signature seen
+            rows = len(self.gait_ids)
+            if self.size == rows:
+                rows *= 2
+            cols = max(self.dim, len(signature))
+            if (rows, cols) != self.matrix.shape:
+                matrix = np.zeros((rows, cols), dtype=np.float32)
+                matrix[:self.size, :self.dim] = self.matrix[:self.size]
+                self.matrix = matrix
+                self.gait_ids = np.resize(self.gait_ids, rows)
+                self.person_ids = np.resize(self.person_ids, rows)
+
+            self.matrix[self.size, :len(signature)] = signature
+            self.matrix[self.size, len(signature):] = 0
+            self.gait_ids[self.size] = gait_id
+            self.person_ids[self.size] = person_id
+            self.rows_by_person.setdefault(person_id, []).append(self.size)
+            self.size += 1
+
+    def fit_probe(self, probe):
+        # Entries beyond the probe's length only meet zeros and vice versa, so cropping keeps the dot product
+        probe = normalize(standardize_embedding(np.asarray(probe, dtype=np.float32).ravel(), self.center, self.scale))
+        fitted = np.zeros(self.dim, dtype=np.float32)
+        length = min(len(probe), self.dim)
+        fitted[:length] = probe[:length]
+        return fitted
+
+    def fit_probes(self, probes):
+        """fit_probe for every row of an (M, D) matrix."""
+        probes = np.asarray(probes, dtype=np.float32).reshape(len(probes), -1)
+        probes = standardize_embedding(probes, self.center, self.scale)
+        norms = np.linalg.norm(probes, axis=1, keepdims=True)
+        probes = probes / np.where(norms > 0, norms, 1)
+        fitted = np.zeros((len(probes), self.dim), dtype=np.float32)
+        length = min(probes.shape[1], self.dim)
+        fitted[:, :length] = probes[:, :length]
+        return fitted
+
+    def scores(self, probe):
+        """Cosine similarity of the probe to every entry."""
+        with self.lock:
+            return self.matrix[:self.size] @ self.fit_probe(probe)
+
+    def top_k(self, probe, k=1, exclude_person_id=None):
+        """
+        The k best matching persons, each with the score and gait_id of their best matching entry.
+        """
+        with self.lock:
+            scores = self.scores(probe)
+            person_ids = self.person_ids[:self.size]
+            gait_ids = self.gait_ids[:self.size]
+            if exclude_person_id is not None:
+                keep = person_ids != exclude_person_id
+                scores, person_ids, gait_ids = scores[keep], person_ids[keep], gait_ids[keep]
+        return rank_persons(scores, person_ids, gait_ids, k)
+
+    def top_k_batch(self, probes, k=1, exclude_person_ids=None, max_block_elements=1 << 24, fitted=False):
+        """
+        top_k for an (M, D) matrix of probes. Returns (person_ids, gait_ids, scores), each of shape (M, k'),
+        where k' = min(k, number of persons); exclude_person_ids optionally gives one person to skip per probe.
+        Slots left without a person, because the probe's excluded person was one of only k' persons, hold
+        person_id and gait_id -1 and score NaN.
+        With fitted, the probes are already fitted to the gallery, e.g. rows of its matrix.
+
+        Probes are scored in blocks against the whole gallery with one matrix product per block; a block has
+        at most max_block_elements scores, which bounds the memory used whatever M is.
+        """
+        with self.lock:
+            if not fitted:
+                probes = self.fit_probes(probes)
+            person_ids = self.person_ids[:self.size]
+            # Gallery rows grouped by person, so per-person maxima are one reduceat per block
+            order = np.argsort(person_ids, kind="stable")
+            persons, starts = np.unique(person_ids[order], return_index=True)
+            grouped = self.matrix[:self.size][order]
+            grouped_gait_ids = self.gait_ids[:self.size][order]
+            lengths = np.diff(np.append(starts, self.size))
+            columns = np.arange(self.size)
+
+            k = min(k, len(persons))
+            result_persons = np.full((len(probes), k), -1, dtype=np.int64)
+            result_gait_ids = np.full((len(probes), k), -1, dtype=np.int64)
+            result_scores = np.full((len(probes), k), np.nan, dtype=np.float32)
+            if k == 0:
+                return result_persons, result_gait_ids, result_scores
+
+            block_size = max(1, max_block_elements // max(self.size, 1))
+            for block_start in range(0, len(probes), block_size):
+                block = slice(block_start, block_start + block_size)
+                scores = probes[block] @ grouped.T
+                person_scores = np.maximum.reduceat(scores, starts, axis=1)
+                # Best entry of every person, for its gait_id: the first of their columns reaching their maximum
+                hits = scores == np.repeat(person_scores, lengths, axis=1)
+                best_entries = np.minimum.reduceat(np.where(hits, columns, self.size), starts, axis=1)
+                if exclude_person_ids is not None:
+                    excluded = persons[None, :] == np.asarray(exclude_person_ids)[block, None]
+                    person_scores[excluded] = -np.inf
+
+                best = np.argpartition(-person_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(person_scores, best, axis=1)
+                ranking = np.argsort(-best_scores, axis=1, kind="stable")
+                best = np.take_along_axis(best, ranking, axis=1)
+                best_scores = np.take_along_axis(best_scores, ranking, axis=1)
+
+                found = best_scores > -np.inf
+                entries = np.take_along_axis(best_entries, best, axis=1)
+                result_persons[block] = np.where(found, persons[best], -1)
+                result_gait_ids[block] = np.where(found, grouped_gait_ids[entries], -1)
+                result_scores[block] = np.where(found, best_scores, np.nan)
+            return result_persons, result_gait_ids, result_scores
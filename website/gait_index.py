@@ -0,0 +1,135 @@
+import os
+import threading
+
+import numpy as np
+
+from gait_gallery import rank_persons
+
+INDEX_PATH = "gait_recognition.ivf.npz"
+
+
+def spherical_kmeans(vectors, num_clusters, num_iters=10, seed=0):
+    """K-means on unit vectors with cosine similarity; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    for _ in range(num_iters):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(num_clusters):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms > 0, norms, 1)
+    return centroids
+
+
+class GaitIndex:
+    """
+    Inverted-file (IVF) approximate nearest neighbour index over a GaitGallery.
+
+    Gallery entries are clustered with spherical k-means; a probe is only scored against the entries of the
+    nprobe clusters whose centroids are closest to it. nprobe is the recall vs latency knob: nprobe equal to
+    the number of clusters is an exact search. Until the gallery has min_train_size entries, searches fall back
+    to the exact gallery scan.
+
+    The index holds cluster assignments only, the vectors stay in the gallery. Centroids and assignments are
+    persisted at path, keyed by gait_id, and new gallery entries are assigned incrementally by sync(). The
+    clusters are retrained when the gallery has grown retrain_factor times since the last training, or when
+    the signature length changes.
+    """
+
+    def __init__(self, path=INDEX_PATH, nprobe=4, min_train_size=256, retrain_factor=4):
+        self.path = path
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.centroids = None
+        self.trained_size = 0
+        self.lists = np.zeros(0, dtype=np.int64)  # Cluster of every gallery row
+        self.lock = threading.RLock()
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self, gallery):
+        with self.lock, gallery.lock:
+            vectors = gallery.matrix[:len(gallery)]
+            num_clusters = max(1, int(np.sqrt(len(vectors))))
+            self.centroids = spherical_kmeans(vectors, num_clusters)
+            self.trained_size = len(vectors)
+            self.lists = self._assign(vectors)
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int64) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+    def sync(self, gallery):
+        """Assign the gallery entries added since the last call, retraining the clusters when needed."""
+        with self.lock, gallery.lock:
+            size = len(gallery)
+            if size < self.min_train_size:
+                self.centroids = None
+                return
+            if (not self.trained or self.centroids.shape[1] != gallery.dim
+                    or size >= self.retrain_factor * self.trained_size):
+                self.train(gallery)
+                return
+            if len(self.lists) < size:
+                self.lists = np.concatenate([self.lists, self._assign(gallery.matrix[len(self.lists):size])])
+
+    def search(self, gallery, probe, k=1, nprobe=None, exclude_person_id=None, exact=False):
+        """
+        The k best matching persons, as GalleryMatch tuples. exact=True scans the whole gallery instead.
+        """
+        with self.lock, gallery.lock:
+            if exact or not self.trained or len(self.lists) != len(gallery):
+                return gallery.top_k(probe, k, exclude_person_id)
+
+            probe = gallery.fit_probe(probe)
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            clusters = np.argpartition(-(self.centroids @ probe), nprobe - 1)[:nprobe]
+            rows = np.flatnonzero(np.isin(self.lists, clusters))
+            person_ids = gallery.person_ids[rows]
+            if exclude_person_id is not None:
+                rows = rows[person_ids != exclude_person_id]
+                person_ids = gallery.person_ids[rows]
+            scores = gallery.matrix[rows] @ probe
+            gait_ids = gallery.gait_ids[rows]
+        return rank_persons(scores, person_ids, gait_ids, k)
+
+    def recall(self, gallery, probes, k=1, nprobe=None):
+        """Fraction of the exact top-k persons that the approximate search also returns."""
+        found, total = 0, 0
+        for probe in probes:
+            exact = {m.person_id for m in self.search(gallery, probe, k, exact=True)}
+            approx = {m.person_id for m in self.search(gallery, probe, k, nprobe=nprobe)}
+            found += len(exact & approx)
+            total += len(exact)
+        return found / total if total else 1.0
+
+    def save(self, gallery):
+        if not self.trained:
+            return
+        with self.lock, gallery.lock:
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(tmp_path, centroids=self.centroids, trained_size=self.trained_size,
+                     gait_ids=gallery.gait_ids[:len(self.lists)], lists=self.lists)
+            os.replace(tmp_path, self.path)
+
+    def load(self, gallery):
+        """Restore the clusters saved for this gallery; entries missing from the file are assigned by sync()."""
+        with self.lock, gallery.lock:
+            if os.path.exists(self.path):
+                saved = np.load(self.path)
+                if saved["centroids"].shape[1] == gallery.dim:
+                    self.centroids = saved["centroids"]
+                    self.trained_size = int(saved["trained_size"])
+                    saved_lists = dict(zip(saved["gait_ids"].tolist(), saved["lists"].tolist()))
+                    # Keep the saved prefix of assignments that still lines up with the gallery rows
+                    lists = []
+                    for gait_id in gallery.gait_ids[:len(gallery)].tolist():
+                        if gait_id not in saved_lists:
+                            break
+                        lists.append(saved_lists[gait_id])
+                    self.lists = np.asarray(lists, dtype=np.int64)
+            self.sync(gallery)
@@ -0,0 +1,118 @@
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+import torch
+
+REGISTRY_DIR = "/content/drive/MyDrive/4D-Humans/website/models"
+
+
+class GaitModelRegistry:
+    """
+    Versioned gait encoders, trained offline and frozen for inference.
+
+    Every registered encoder is saved as <root>/gait_encoder_v<version>.pt and described in
+    <root>/registry.json. The features of every enrolled walk are kept in <root>/corpus, so that new encoders
+    can be trained on the accumulated corpus and stored signatures re-embedded with them.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.corpus_dir = os.path.join(root, "corpus")
+        self.manifest_path = os.path.join(root, "registry.json")
+        self._lock = threading.Lock()
+        # Held while the first encoder is trained, so that concurrent jobs do not each register one
+        self.bootstrap_lock = threading.Lock()
+        self._models = {}
+        os.makedirs(self.corpus_dir, exist_ok=True)
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"versions": []}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def versions(self):
+        return self._read_manifest()["versions"]
+
+    def latest_version(self):
+        versions = self.versions()
+        return versions[-1]["version"] if versions else None
+
+    def register(self, model, input_dim, **metrics):
+        """Save a trained encoder as the next version and return that version."""
+        with self._lock:
+            manifest = self._read_manifest()
+            version = manifest["versions"][-1]["version"] + 1 if manifest["versions"] else 1
+            path = os.path.join(self.root, f"gait_encoder_v{version}.pt")
+            torch.save(model.state_dict(), path)
+            manifest["versions"].append({
+                "version": version,
+                "path": path,
+                "input_dim": input_dim,
+                "created_at": datetime.datetime.utcnow().isoformat(),
+                **metrics,
+            })
+            self._write_manifest(manifest)
+        print(f"Registered gait encoder version {version}")
+        return version
+
+    def load(self, model_class, version=None, device="cpu"):
+        """
+        Load a registered encoder (the latest by default) in eval mode. Loaded models are cached.
+        Returns (model, version).
+        """
+        with self._lock:
+            entries = {entry["version"]: entry for entry in self._read_manifest()["versions"]}
+            if not entries:
+                raise FileNotFoundError(f"No gait encoder registered in {self.root}")
+            version = version if version is not None else max(entries)
+            if version not in self._models:
+                entry = entries[version]
+                model = model_class(entry["input_dim"])
+                model.load_state_dict(torch.load(entry["path"], map_location="cpu"))
+                model.eval()
+                for param in model.parameters():
+                    param.requires_grad_(False)
+                self._models[version] = model
+            return self._models[version].to(device), version
+
+    def save_features(self, features, name):
+        """Add the features of one walk to the training corpus, returns their path."""
+        path = os.path.join(self.corpus_dir, f"{name}.npy")
+        np.save(path, np.asarray(features, dtype=np.float32))
+        return path
+
+    def corpus_paths(self):
+        return sorted(os.path.join(self.corpus_dir, name) for name in os.listdir(self.corpus_dir) if name.endswith(".npy"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from gaitsignature import reembed_stale_signatures, train_registered_encoder
+
+    parser = argparse.ArgumentParser(description="Train gait encoders offline and re-embed stored signatures.")
+    parser.add_argument("command", choices=["train", "reembed", "list"])
+    parser.add_argument("--root", default=REGISTRY_DIR)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--version", type=int, default=None, help="Encoder version to re-embed with, latest by default")
+    args = parser.parse_args()
+
+    registry = GaitModelRegistry(args.root)
+    if args.command == "train":
+        version = train_registered_encoder(registry, num_epochs=args.epochs)
+        reembed_stale_signatures(registry, version)
+    elif args.command == "reembed":
+        reembed_stale_signatures(registry, args.version)
+    else:
+        for entry in registry.versions():
+            print(json.dumps(entry))
@@ -0,0 +1,109 @@
+import threading
+
+import numpy as np
+
+from gait_gallery import rank_persons
+
+
+class PersonTemplates:
+    """
+    One template per enrolled person: the running mean and covariance (Welford's algorithm) of the person's
+    L2-normalised gallery rows, and the number of enrollments they summarise.
+
+    Identification scores the probe against the normalised template means, one product per person, and then
+    re-ranks the individual samples of the best persons only.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.person_ids = np.zeros(0, dtype=np.int64)
+            self.counts = np.zeros(0, dtype=np.int64)
+            self.means = np.zeros((0, 0), dtype=np.float32)
+            self.m2 = np.zeros((0, 0, 0), dtype=np.float32)  # Sums of squared deviations, per person
+            self.rows = {}  # person_id -> row of the arrays above
+
+    @property
+    def dim(self):
+        return self.means.shape[1]
+
+    def __len__(self):
+        return len(self.person_ids)
+
+    def set(self, person_id, count, mean, m2):
+        """Add or replace the template of a person."""
+        mean = np.asarray(mean, dtype=np.float32).ravel()
+        m2 = np.asarray(m2, dtype=np.float32).reshape(len(mean), len(mean))
+        with self.lock:
+            if len(self) == 0:
+                self.means = np.zeros((0, len(mean)), dtype=np.float32)
+                self.m2 = np.zeros((0, len(mean), len(mean)), dtype=np.float32)
+            if person_id not in self.rows:
+                self.rows[person_id] = len(self.person_ids)
+                self.person_ids = np.append(self.person_ids, person_id)
+                self.counts = np.append(self.counts, 0)
+                self.means = np.concatenate([self.means, np.zeros((1, self.dim), dtype=np.float32)])
+                self.m2 = np.concatenate([self.m2, np.zeros((1, self.dim, self.dim), dtype=np.float32)])
+            row = self.rows[person_id]
+            self.counts[row] = count
+            self.means[row] = mean
+            self.m2[row] = m2
+
+    def update(self, person_id, vector):
+        """Fold one more normalised gallery row of a person into their template."""
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        with self.lock:
+            if person_id not in self.rows:
+                self.set(person_id, 1, vector, np.zeros((len(vector), len(vector)), dtype=np.float32))
+                return
+            row = self.rows[person_id]
+            self.counts[row] += 1
+            delta = vector - self.means[row]
+            self.means[row] += delta / self.counts[row]
+            self.m2[row] += np.outer(delta, vector - self.means[row])
+
+    def covariance(self, person_id):
+        with self.lock:
+            row = self.rows[person_id]
+            return self.m2[row] / max(self.counts[row] - 1, 1)
+
+    def rebuild(self, gallery):
+        """Recompute every template from the gallery rows."""
+        with self.lock, gallery.lock:
+            self.clear()
+            for i in range(len(gallery)):
+                self.update(int(gallery.person_ids[i]), gallery.matrix[i])
+
+    def top_persons(self, probe, n, exclude_person_id=None):
+        """The n persons whose normalised template mean is closest to a probe already fitted to the gallery."""
+        with self.lock:
+            norms = np.linalg.norm(self.means, axis=1)
+            scores = (self.means @ probe) / np.where(norms > 0, norms, 1)
+            person_ids = self.person_ids
+            if exclude_person_id is not None:
+                keep = person_ids != exclude_person_id
+                scores, person_ids = scores[keep], person_ids[keep]
+            n = min(n, len(scores))
+            if n == 0:
+                return person_ids[:0]
+            best = np.argpartition(-scores, n - 1)[:n]
+            return person_ids[best]
+
+
+def search_templates(gallery, templates, probe, k=1, rerank=4, exclude_person_id=None):
+    """
+    The k best matching persons as GalleryMatch tuples: the k * rerank persons with the closest templates
+    are shortlisted, then their individual gallery samples are scored.
+    """
+    with gallery.lock, templates.lock:
+        probe = gallery.fit_probe(probe)
+        persons = templates.top_persons(probe, k * rerank, exclude_person_id)
+        rows = [row for person_id in persons.tolist() for row in gallery.rows_by_person.get(person_id, [])]
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = gallery.matrix[rows] @ probe
+        person_ids = gallery.person_ids[rows]
+        gait_ids = gallery.gait_ids[rows]
+    return rank_persons(scores, person_ids, gait_ids, k)
@@ -1,16 +1,24 @@
 import torch
 import numpy as np
-import json
 import torch.nn.functional as F
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import Dataset
 from sklearn.model_selection import train_test_split
-from gait_database import insert_gait_signature
-import matplotlib.pyplot as plt
+from gait_database import get_encoder_version, insert_gait_signature, get_stale_gait_entries, update_gait_embeddings
+from gait_embedding import pool_gait_signature
+from gait_model_registry import GaitModelRegistry
+from preprocessing import load_walk
+import copy
+import os
+import time
+import uuid
 
 
 torch.manual_seed(42)
 np.random.seed(42)
 
+# Registered gait encoders, shared by every job so that a loaded encoder stays cached
+model_registry = GaitModelRegistry()
+
 # Define Autoencoder model
 class GaitAutoencoder(torch.nn.Module):
     def __init__(self, input_dim):
@@ -39,62 +47,116 @@ class GaitAutoencoder(torch.nn.Module):
         return x
 
 # Function to load input data (joint positions)
-def load_input_data(file_path):
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-
-    frames = data.get("frames", [])
-    if not frames:
-        raise ValueError("No frame data found in JSON file.")
-
-    all_features = []
-
-    for frame in frames:
-        # Extract all available features
-        joints = frame.get("joints", [])
-        betas = frame.get("betas", [])
-        global_orient = frame.get("global_orient", [])
-        body_pose = frame.get("body_pose", [])
-
-        # Convert to numpy arrays and flatten
-        feature_vector = np.concatenate([
-            np.array(joints).flatten(),
-            np.array(betas).flatten(),
-            np.array(global_orient).flatten(),
-            np.array(body_pose).flatten()
-        ])
-
-        all_features.append(feature_vector)
+def load_input_data(source):
+    # source is a preprocessed walk (in memory or .npy) or a frame store directory
+    frames = load_walk(source)
+    num_frames = len(frames['joints'])
+    if num_frames == 0:
+        raise ValueError("No frame data found.")
+    # Prefer the trajectories smoothed during preprocessing, the same ones the animation shows
+    joints = frames['joints_smoothed'] if 'joints_smoothed' in frames else frames['joints']
+
+    # Flatten all available features of every frame into one contiguous float32 row
+    all_features = np.concatenate([
+        np.asarray(joints).reshape(num_frames, -1),
+        np.asarray(frames['betas']).reshape(num_frames, -1),
+        np.asarray(frames['global_orient']).reshape(num_frames, -1),
+        np.asarray(frames['body_pose']).reshape(num_frames, -1)
+    ], axis=1).astype(np.float32, copy=False)
 
     return all_features
 
-# Dataset class
+# Dataset class, holding all frames as one float32 tensor; indexing with a batch of indices slices it directly
 class GaitDataset(Dataset):
-    def __init__(self, features):
-        self.features = features
+    def __init__(self, features, device="cpu"):
+        self.features = torch.as_tensor(features, dtype=torch.float32).to(device).contiguous()
 
     def __len__(self):
         return len(self.features)
 
     def __getitem__(self, idx):
-        return torch.tensor(self.features[idx], dtype=torch.float32)
+        return self.features[idx]
 
-# Function to train autoencoder to generate gait signature
-def train_autoencoder(file_path, num_epochs=100, batch_size=32, learning_rate=0.001, test_split=0.2):
-    features = load_input_data(file_path)
+# Batch loader that slices the dataset tensor, replacing per-sample indexing and collation by a DataLoader
+class TensorBatchLoader:
+    def __init__(self, dataset, batch_size=32, shuffle=False):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
 
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        features = self.dataset.features
+        if self.shuffle:
+            order = torch.randperm(len(features), device=features.device)
+            for start in range(0, len(features), self.batch_size):
+                yield features[order[start:start + self.batch_size]]
+        else:
+            yield from torch.split(features, self.batch_size)
+
+# Decides when training stops: after patience epochs without improving the test loss by min_delta,
+# or once max_seconds of wall-clock time have been spent. Keeps the weights of the best epoch.
+class TrainingBudget:
+    def __init__(self, num_epochs=100, patience=10, min_delta=1e-4, max_seconds=None):
+        self.num_epochs = num_epochs
+        self.patience = patience
+        self.min_delta = min_delta
+        self.max_seconds = max_seconds
+        self.start_time = time.monotonic()
+        self.best_loss = float("inf")
+        self.best_epoch = 0
+        self.best_state = None
+        self.epochs = 0
+        self.stop_reason = "max_epochs"
+
+    def step(self, model, epoch, test_loss):
+        """Record the test loss of an epoch (1-based), returns True when training should stop."""
+        self.epochs = epoch
+        if test_loss < self.best_loss - self.min_delta:
+            self.best_loss = test_loss
+            self.best_epoch = epoch
+            self.best_state = copy.deepcopy(model.state_dict())
+        if self.patience is not None and epoch - self.best_epoch >= self.patience:
+            self.stop_reason = "early_stopping"
+            return True
+        if self.max_seconds is not None and time.monotonic() - self.start_time >= self.max_seconds:
+            self.stop_reason = "time_limit"
+            return True
+        return False
+
+    def restore_best(self, model):
+        if self.best_state is not None:
+            model.load_state_dict(self.best_state)
+
+    def report(self):
+        return {
+            "epochs": self.epochs,
+            "best_epoch": self.best_epoch,
+            "test_loss": self.best_loss,
+            "stop_reason": self.stop_reason,
+            "seconds": round(time.monotonic() - self.start_time, 2),
+        }
+
+# Function to train an autoencoder on gait features
+# lr_schedule: None, "plateau" (divide the learning rate by 10 when the test loss stalls) or "cosine"
+def fit_autoencoder(features, num_epochs=100, batch_size=32, learning_rate=0.001, test_split=0.2,
+                    patience=10, min_delta=1e-4, max_seconds=None, lr_schedule=None):
     # Ensure all feature vectors have the same dimension
     input_dim = len(features[0])
 
     # Split dataset
     train_features, test_features = train_test_split(features, test_size=test_split, random_state=42)
 
-    # Create Datasets and DataLoaders
-    train_dataset = GaitDataset(train_features)
-    test_dataset = GaitDataset(test_features)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+    # Create Datasets and loaders; the features are moved to the device once, not per batch
+    train_dataset = GaitDataset(train_features, device)
+    test_dataset = GaitDataset(test_features, device)
+
+    train_loader = TensorBatchLoader(train_dataset, batch_size=batch_size, shuffle=True)
+    test_loader = TensorBatchLoader(test_dataset, batch_size=batch_size, shuffle=False)
 
     model = GaitAutoencoder(input_dim)
     model.train()
@@ -102,15 +164,22 @@ def train_autoencoder(file_path, num_epochs=100, batch_size=32, learning_rate=0.
     criterion = torch.nn.MSELoss()
     optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model.to(device)
 
+    if lr_schedule == "plateau":
+        scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, factor=0.1, patience=max(1, (patience or 10) // 2))
+    elif lr_schedule == "cosine":
+        scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=num_epochs)
+    elif lr_schedule is None:
+        scheduler = None
+    else:
+        raise ValueError(f"Unknown learning rate schedule: {lr_schedule}")
+
+    budget = TrainingBudget(num_epochs, patience, min_delta, max_seconds)
     for epoch in range(num_epochs):
         model.train()
         train_loss = 0.0
         for batch_data in train_loader:
-            batch_data = batch_data.to(device)
-
             reconstructed = model(batch_data)
 
             loss = criterion(reconstructed, batch_data)
@@ -127,7 +196,6 @@ def train_autoencoder(file_path, num_epochs=100, batch_size=32, learning_rate=0.
         test_loss = 0.0
         with torch.no_grad():
             for batch_data in test_loader:
-                batch_data = batch_data.to(device)
                 reconstructed = model(batch_data)
                 loss = criterion(reconstructed, batch_data)
                 test_loss += loss.item()
@@ -136,20 +204,90 @@ def train_autoencoder(file_path, num_epochs=100, batch_size=32, learning_rate=0.
 
         print(f'Epoch [{epoch+1}/{num_epochs}], Train Loss: {avg_train_loss:.4f}, Test Loss: {avg_test_loss:.4f}')
 
-    store_gait_signature(model, test_dataset, device)
-
-def store_gait_signature(model, test_dataset, device):
+        if isinstance(scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+            scheduler.step(avg_test_loss)
+        elif scheduler is not None:
+            scheduler.step()
+
+        if budget.step(model, epoch + 1, avg_test_loss):
+            break
+
+    budget.restore_best(model)
+    report = budget.report()
+    print(f"Training stopped after {report['epochs']} epochs ({report['stop_reason']}), "
+          f"best Test Loss: {report['test_loss']:.4f} at epoch {report['best_epoch']}")
+    return model, device, test_dataset, report
+
+# Function to train a gait encoder offline on the accumulated corpus and register it as a new version
+def train_registered_encoder(registry, feature_paths=None, num_epochs=100, batch_size=32, learning_rate=0.001, test_split=0.2):
+    feature_paths = feature_paths if feature_paths is not None else registry.corpus_paths()
+    if not feature_paths:
+        raise ValueError("The gait feature corpus is empty.")
+    features = np.concatenate([np.load(path) for path in feature_paths])
+
+    model, _, _, report = fit_autoencoder(features, num_epochs, batch_size, learning_rate, test_split, lr_schedule="plateau")
+    return registry.register(model.cpu(), features.shape[1], num_walks=len(feature_paths), num_frames=len(features), **report)
+
+# Function to encode the frames of a walk as whole tensors rather than frame by frame
+def encode_features(model, features, device, batch_size=None, inference_mode=True):
+    """
+    Per-frame gait codes of features, shape (T, D) -> (T, 32). The frames are moved to the device and encoded
+    in batches of batch_size (all at once by default), under torch.inference_mode unless inference_mode=False.
+    """
+    features = torch.as_tensor(features if torch.is_tensor(features) else np.asarray(features), dtype=torch.float32)
+    batch_size = batch_size or max(len(features), 1)
+    was_training = model.training
     model.eval()
-    with torch.no_grad():
-        all_signatures = []
-        for i in range(len(test_dataset)):
-            sample_gait = test_dataset[i].unsqueeze(0).to(device)
-            gait_signature = model.encode(sample_gait) 
-            all_signatures.append(gait_signature.cpu().numpy().flatten())
+    try:
+        with torch.inference_mode() if inference_mode else torch.no_grad():
+            codes = [model.encode(batch.to(device, non_blocking=True)).cpu()
+                     for batch in torch.split(features, batch_size)]
+    finally:
+        model.train(was_training)
+    return torch.cat(codes).numpy() if codes else np.zeros((0, model.fc3.out_features), dtype=np.float32)
+
+# Function to enroll a walk with the frozen, registered gait encoder
+def embed_walk(file_path, registry=None):
+    registry = registry if registry is not None else model_registry
+    features = load_input_data(file_path)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-        all_signatures = np.array(all_signatures)
+    training = None
+    if registry.latest_version() is None:
+        with registry.bootstrap_lock:
+            # Check again: a concurrent job may have registered the first encoder while this one waited
+            if registry.latest_version() is None:
+                # Bootstrap the registry with an encoder trained on this first walk, within the per-upload time budget
+                max_seconds = float(os.environ.get("GAIT_TRAIN_MAX_SECONDS", 300))
+                model, _, _, training = fit_autoencoder(features, max_seconds=max_seconds)
+                registry.register(model.cpu(), features.shape[1], num_walks=1, num_frames=len(features), **training)
+
+    # Walks are embedded with the encoder of the stored embeddings, even when a newer one is registered, until
+    # the stored embeddings are re-embedded with it; the latest encoder while none is recorded
+    model, version = registry.load(GaitAutoencoder, version=get_encoder_version(), device=device)
+    if model.fc1.in_features != features.shape[1]:
+        raise ValueError(f"Gait encoder v{version} expects {model.fc1.in_features} features, got {features.shape[1]}")
+
+    gait_codes = encode_features(model, features, device)
+    embedding = pool_gait_signature(gait_codes, cycle_aligned=True)
+    # The features join the training corpus only if the walk is a new entry
+    person_id = insert_gait_signature(gait_codes, embedding, encoder_version=version,
+                                      save_features=lambda: registry.save_features(features, uuid.uuid4().hex))
+    if person_id is None:
+        raise RuntimeError(f"Enrollment of the walk in {file_path} failed")
+    return {"person_id": person_id, "encoder_version": version, "training": training, "embedding": embedding}
+
+# Function to re-embed the stored signatures made by older encoders
+def reembed_stale_signatures(registry=None, version=None):
+    registry = registry if registry is not None else model_registry
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model, version = registry.load(GaitAutoencoder, version=version, device=device)
 
-        # Ensure full array is printed
-        np.set_printoptions(threshold=np.inf)
+    updates = []
+    for gait_id, features_path in get_stale_gait_entries(version):
+        gait_codes = encode_features(model, np.load(features_path), device)
+        updates.append((gait_id, gait_codes, pool_gait_signature(gait_codes, cycle_aligned=True)))
 
-        person_id = insert_gait_signature(all_signatures)
+    update_gait_embeddings(updates, version)
+    print(f"Re-embedded {len(updates)} gait signatures with encoder v{version}")
+    return len(updates)
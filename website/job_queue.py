@@ -0,0 +1,166 @@
+import datetime
+import json
+import threading
+import traceback
+
+from sqlalchemy import Column, DateTime, Integer, String, Text, update
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+Base = declarative_base()
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+# Define the Job table
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    video_id = Column(Integer, nullable=False, index=True)
+    state = Column(String, nullable=False, default=JOB_QUEUED, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON encoded return value of the handler
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "video_id": self.video_id,
+            "state": self.state,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "error": self.error,
+            "result": json.loads(self.result) if self.result else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class JobQueue:
+    """
+    Durable queue of video analysis jobs, stored in the jobs table, drained by a fixed pool of worker threads.
+
+    Jobs go queued -> running -> done, or back to queued on failure until max_attempts is reached, then failed.
+    Jobs left running by a previous process are queued again on start().
+    """
+
+    def __init__(self, engine, handler, num_workers=1, max_attempts=3, poll_interval=2.0, on_update=None):
+        # handler(job_id, video_id) runs a job and returns a JSON serialisable result, or raises on failure.
+        # on_update(job_dict) is called after every state change.
+        self.engine = engine
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.on_update = on_update
+        self.Session = sessionmaker(bind=engine)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers = []
+        Base.metadata.create_all(engine)
+
+    def start(self):
+        session = self.Session()
+        try:
+            session.execute(update(Job).where(Job.state == JOB_RUNNING).values(state=JOB_QUEUED))
+            session.commit()
+        finally:
+            session.close()
+
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def enqueue(self, video_id):
+        session = self.Session()
+        try:
+            job = Job(video_id=video_id, state=JOB_QUEUED, max_attempts=self.max_attempts)
+            session.add(job)
+            session.commit()
+            job_dict = job.to_dict()
+        finally:
+            session.close()
+        self._notify(job_dict)
+        self._wakeup.set()
+        return job_dict["id"]
+
+    def get(self, job_id):
+        session = self.Session()
+        try:
+            job = session.query(Job).get(job_id)
+            return job.to_dict() if job else None
+        finally:
+            session.close()
+
+    def _notify(self, job_dict):
+        if self.on_update is not None:
+            try:
+                self.on_update(job_dict)
+            except Exception as e:
+                print(f"Error publishing job status: {e}")
+
+    def _claim(self):
+        # Atomically move the oldest queued job to running; another worker may win the race
+        session = self.Session()
+        try:
+            while True:
+                job = session.query(Job).filter(Job.state == JOB_QUEUED).order_by(Job.id).first()
+                if job is None:
+                    return None
+                claimed = session.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.state == JOB_QUEUED)
+                    .values(state=JOB_RUNNING, attempts=Job.attempts + 1, updated_at=datetime.datetime.utcnow())
+                )
+                session.commit()
+                if claimed.rowcount == 1:
+                    session.refresh(job)
+                    return job.to_dict()
+        finally:
+            session.close()
+
+    def _finish(self, job_id, state, result=None, error=None):
+        session = self.Session()
+        try:
+            job = session.query(Job).get(job_id)
+            job.state = state
+            job.result = json.dumps(result) if result is not None else None
+            job.error = error
+            session.commit()
+            job_dict = job.to_dict()
+        finally:
+            session.close()
+        self._notify(job_dict)
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._notify(job)
+            try:
+                result = self.handler(job["id"], job["video_id"])
+            except Exception as e:
+                traceback.print_exc()
+                state = JOB_QUEUED if job["attempts"] < job["max_attempts"] else JOB_FAILED
+                self._finish(job["id"], state, error=f"{type(e).__name__}: {e}")
+            else:
+                self._finish(job["id"], JOB_DONE, result=result)
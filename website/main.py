@@ -1,17 +1,16 @@
-from gaitsignature import train_autoencoder
-from gait_database import human_identification
-from gait_database import get_gait_signature_from_last_person
-from gait_database import get_most_recent_person_id
+from gaitsignature import embed_walk
+from gait_database import identify_walk
 
 
 
-def results():
-  file_path = "/content/drive/MyDrive/4D-Humans/website/output/walking_man_preprocessed.json"
-  train_autoencoder(file_path)
+def results(file_path):
+  # Enroll the walk with the frozen, registered gait encoder
+  enrollment = embed_walk(file_path)
+  embedding = enrollment.pop("embedding")
 
-  end_gait_signature=get_gait_signature_from_last_person()
-  if end_gait_signature is None:
-      print("Error: Gait signature is None.")
-  else:
-      human_identification()
+  # Identify this walk, not the last one enrolled, among everyone but the person it was enrolled as.
+  # Errors are raised, so that the job fails and is retried instead of remembering a missing identification.
+  enrollment["identification"] = identify_walk(embedding, exclude_person_id=enrollment["person_id"])
+
+  return enrollment
 
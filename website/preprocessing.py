@@ -0,0 +1,117 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from hmr2.utils.frame_store import META_FILE, FrameStoreReader
+from trajectory_filters import smooth_trajectory
+
+# Raw SMPL fields that preprocessing reads, the input hash covers exactly these
+INPUT_FIELDS = ('joints', 'betas', 'body_pose', 'global_orient', 'vertices', 'vertices_decimated')
+
+
+def frame_store_digest(root, smoothing='gaussian'):
+    """SHA-256 of the recorded frames preprocessing depends on, and of the preprocessing settings."""
+    frames = FrameStoreReader(root)
+    sha256 = hashlib.sha256()
+    with open(os.path.join(root, META_FILE), 'rb') as f:
+        sha256.update(f.read())
+    sha256.update(smoothing.encode())
+    for name in INPUT_FIELDS:
+        if name in frames and len(frames):
+            sha256.update(np.ascontiguousarray(frames[name]))
+    return sha256.hexdigest()
+
+
+def preprocess_walk(root, smoothing='gaussian'):
+    """
+    Convert the raw SMPL frame store of a tracking run into one structured array with a row per frame:
+    the first person of every frame, without the batch dimension, plus the smoothed joint trajectories.
+    Vertices are included when they were recorded, decimated or not.
+    """
+    data = FrameStoreReader(root)
+    if len(data) == 0:
+        raise ValueError("SMPL frame store is empty.")
+
+    # Keep the first person of every frame and drop the batch dimension
+    fields = {
+        'joints': data.first_in_batch('joints'),
+        'betas': data.first_in_batch('betas'),
+        'body_pose': data.first_in_batch('body_pose')[:, 0],
+        'global_orient': data.first_in_batch('global_orient')[:, 0],
+    }
+    # Smooth the joint trajectories once, for both the animation and the gait features
+    fields['joints_smoothed'] = smooth_trajectory(fields['joints'], method=smoothing)
+    if 'vertices' in data:
+        fields['vertices'] = data.first_in_batch('vertices')
+    elif 'vertices_decimated' in data:
+        fields['vertices'] = data.first_in_batch('vertices_decimated')
+
+    dtype = np.dtype([(name, np.float32, array.shape[1:]) for name, array in fields.items()])
+    walk = np.empty(len(fields['joints']), dtype=dtype)
+    for name, array in fields.items():
+        walk[name] = array
+    return walk
+
+
+def load_walk(source):
+    """
+    Fields of a walk as a dict of (T, ...) arrays. source is a preprocessed walk, in memory or saved with
+    np.save, or the directory of a frame store.
+    """
+    if isinstance(source, np.ndarray):
+        return {name: source[name] for name in source.dtype.names}
+    if os.path.isdir(source):
+        frames = FrameStoreReader(source)
+        return {name: frames[name] for name in frames.keys()}
+    walk = np.load(source)
+    return {name: walk[name] for name in walk.dtype.names}
+
+
+class PreprocessCache:
+    """
+    Preprocessed walks, keyed by job and input hash, so that every stage of a job gets the same array in
+    memory and a retried job skips preprocessing when its recorded frames did not change. The most recent
+    max_entries walks are kept in memory; every walk is also saved to the output_path given by the job, with
+    its input hash alongside, where a restarted process finds it again.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._walks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id, smpl_frames, output_path, smoothing='gaussian'):
+        digest = frame_store_digest(smpl_frames, smoothing)
+        key = (job_id, digest)
+        with self._lock:
+            if key in self._walks:
+                self._walks.move_to_end(key)
+                return self._walks[key]
+
+        digest_path = output_path + '.sha256'
+        saved_digest = None
+        if os.path.exists(digest_path) and os.path.exists(output_path):
+            with open(digest_path, 'r') as f:
+                saved_digest = f.read()
+        if saved_digest == digest:
+            walk = np.load(output_path)
+        else:
+            walk = preprocess_walk(smpl_frames, smoothing)
+            np.save(output_path, walk)
+            with open(digest_path, 'w') as f:
+                f.write(digest)
+            print("Frame store preprocessed successfully.")
+
+        with self._lock:
+            self._walks[key] = walk
+            while len(self._walks) > self.max_entries:
+                self._walks.popitem(last=False)
+        return walk
+
+    def discard(self, job_id):
+        with self._lock:
+            for key in [key for key in self._walks if key[0] == job_id]:
+                del self._walks[key]
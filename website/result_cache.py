@@ -0,0 +1,112 @@
+import datetime
+import json
+import os
+import threading
+
+from sqlalchemy import BigInteger, Column, DateTime, String, Text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+Base = declarative_base()
+
+RESULT_CACHE_BYTES = 5 * 1024 ** 3
+
+# Artifacts kept per analysed video, each a blob store digest
+ARTIFACTS = ("mesh_hash", "animate_hash")
+
+
+# Define the CachedResult table
+class CachedResult(Base):
+    __tablename__ = 'result_cache'
+
+    video_hash = Column(String(64), primary_key=True)  # SHA-256 of the uploaded video
+    mesh_hash = Column(String(64), nullable=True)
+    animate_hash = Column(String(64), nullable=True)
+    result = Column(Text, nullable=True)  # JSON encoded job result: enrollment and identification
+    size = Column(BigInteger, nullable=False, default=0)  # Bytes of the artifacts, shared with videos or not
+    last_used = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    def to_dict(self):
+        entry = {name: getattr(self, name) for name in ARTIFACTS}
+        entry["result"] = json.loads(self.result) if self.result else None
+        return entry
+
+
+class ResultCache:
+    """
+    Analysis results of previously seen videos, keyed by the SHA-256 of the video content, so that a video
+    uploaded again is not analysed again.
+
+    The artifacts live in the blob store and are shared: the mesh and animation videos are also referred to
+    by the Video rows of the uploads they were made for, and in_use(digest) reports whether something other
+    than the cache still refers to a blob. Only the blobs no longer in use are owned by the cache, and only
+    those count towards max_bytes. When they take more, the least recently used entries are evicted and
+    their owned blobs deleted; entries whose blobs are all in use cost no space and are kept.
+    """
+
+    def __init__(self, engine, blob_store, max_bytes=RESULT_CACHE_BYTES, in_use=None):
+        self.blob_store = blob_store
+        self.max_bytes = max_bytes
+        self.in_use = in_use
+        self.Session = sessionmaker(bind=engine)
+        self._lock = threading.Lock()
+        Base.metadata.create_all(engine)
+
+    def _owned_bytes(self, entry):
+        """Bytes of the entry's blobs that nothing but the cache refers to."""
+        return sum(os.path.getsize(self.blob_store.path(digest)) for digest in self._digests(entry)
+                   if self.blob_store.exists(digest) and not (self.in_use is not None and self.in_use(digest)))
+
+    def _digests(self, entry):
+        return [getattr(entry, name) for name in ARTIFACTS if getattr(entry, name)]
+
+    def get(self, video_hash):
+        """Artifacts and result of a video, or None if it was not analysed or its artifacts are gone."""
+        session = self.Session()
+        try:
+            entry = session.query(CachedResult).get(video_hash)
+            if entry is None:
+                return None
+            if not all(self.blob_store.exists(getattr(entry, name)) for name in ARTIFACTS if getattr(entry, name)):
+                session.delete(entry)
+                session.commit()
+                return None
+            entry.last_used = datetime.datetime.utcnow()
+            session.commit()
+            return entry.to_dict()
+        finally:
+            session.close()
+
+    def put(self, video_hash, result=None, **artifacts):
+        """Record the artifacts (mesh_hash, animate_hash) and result of an analysed video."""
+        size = sum(os.path.getsize(self.blob_store.path(digest)) for digest in artifacts.values()
+                   if self.blob_store.exists(digest))
+        session = self.Session()
+        try:
+            session.merge(CachedResult(video_hash=video_hash, result=json.dumps(result) if result is not None else None,
+                                       size=size, last_used=datetime.datetime.utcnow(), **artifacts))
+            session.commit()
+        finally:
+            session.close()
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the blobs owned by the cache fit in max_bytes."""
+        with self._lock:
+            session = self.Session()
+            try:
+                entries = session.query(CachedResult).order_by(CachedResult.last_used.desc()).all()
+                total = 0
+                for entry in entries:
+                    owned = self._owned_bytes(entry)
+                    total += owned
+                    if owned == 0 or total <= self.max_bytes:
+                        continue
+                    for digest in self._digests(entry):
+                        if not (self.in_use is not None and self.in_use(digest)):
+                            self.blob_store.delete(digest)
+                    print(f"Evicted cached result of video {entry.video_hash}")
+                    session.delete(entry)
+                session.commit()
+            finally:
+                session.close()
@@ -0,0 +1,209 @@
+import copy
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Pairs of joint indices drawn as bones
+SKELETON_CONNECTIONS = [
+    (0, 9),  # Pelvis to Spine1
+    (9, 10),  # Spine1 to Spine2
+    (10, 11),  # Spine2 to Spine3
+    (11, 12),  # Spine3 to Neck
+    (12, 13),  # Neck to Head
+
+    (9, 14),  # Spine1 to Left Shoulder
+    (14, 15),  # Left Shoulder to Left Elbow
+    (15, 16),  # Left Elbow to Left Wrist
+
+    (9, 17),  # Spine1 to Right Shoulder
+    (17, 18),  # Right Shoulder to Right Elbow
+    (18, 19),  # Right Elbow to Right Wrist
+
+    (0, 1),  # Pelvis to Left Hip
+    (1, 2),  # Left Hip to Left Knee
+    (2, 3),  # Left Knee to Left Ankle
+    (3, 4),  # Left Ankle to Left Foot
+
+    (0, 5),  # Pelvis to Right Hip
+    (5, 6),  # Right Hip to Right Knee
+    (6, 7),  # Right Knee to Right Ankle
+    (7, 8)   # Right Ankle to Right Foot
+]
+
+# BGR colours
+BACKGROUND_COLOR = (255, 255, 255)
+JOINT_COLOR = (0, 0, 255)
+BONE_COLOR = (0, 0, 0)
+VERTEX_COLOR = (230, 200, 170)
+
+
+def view_axes(elev, azim):
+    """
+    Screen axes of an orthographic camera placed like matplotlib's Axes3D.view_init(elev, azim):
+    a (2, 3) matrix mapping a 3D point to its (right, up) screen coordinates.
+    """
+    elev, azim = np.deg2rad(elev), np.deg2rad(azim)
+    right = [-np.sin(azim), np.cos(azim), 0.0]
+    up = [-np.sin(elev) * np.cos(azim), -np.sin(elev) * np.sin(azim), np.cos(elev)]
+    return np.array([right, up], dtype=np.float32)
+
+
+class SkeletonRenderer:
+    """
+    Rasterises SMPL joints, and optionally vertices, into BGR frames with NumPy and OpenCV.
+
+    Points are projected orthographically with the same view as the matplotlib animation. The projection is
+    fitted once to the joints of the whole walk, so the body moves through a fixed frame instead of being
+    re-centred every frame. Frames are drawn into one reusable buffer.
+    """
+
+    def __init__(self, width=800, height=640, elev=100, azim=90, margin=0.1, title='SMPL Model Animation'):
+        self.width = width
+        self.height = height
+        self.axes = view_axes(elev, azim)
+        self.margin = margin
+        self.title = title
+        self.scale = 1.0
+        self.offset = np.zeros(2, dtype=np.float32)
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+
+    def fit(self, joints):
+        """Choose scale and offset so that the joints of every frame, shape (T, J, 3), fit in the image."""
+        projected = np.asarray(joints, dtype=np.float32).reshape(-1, 3) @ self.axes.T
+        low, high = projected.min(axis=0), projected.max(axis=0)
+        extent = np.maximum(high - low, 1e-6)
+        usable = np.array([self.width, self.height], dtype=np.float32) * (1 - 2 * self.margin)
+        self.scale = float(np.min(usable / extent))
+        center = (low + high) / 2
+        self.offset = np.array([self.width / 2, self.height / 2], dtype=np.float32) - center * [self.scale, -self.scale]
+        return self
+
+    def project(self, points):
+        """Pixel coordinates of 3D points, shape (N, 3) -> (N, 2) int32. Screen y points down."""
+        screen = np.asarray(points, dtype=np.float32) @ self.axes.T
+        pixels = screen * [self.scale, -self.scale] + self.offset
+        return np.rint(pixels).astype(np.int32)
+
+    def render(self, joints, vertices=None):
+        """Draw one frame and return the frame buffer, which is overwritten by the next call."""
+        frame = self.frame
+        frame[:] = BACKGROUND_COLOR
+
+        if vertices is not None:
+            pixels = self.project(vertices)
+            inside = ((pixels[:, 0] >= 0) & (pixels[:, 0] < self.width)
+                      & (pixels[:, 1] >= 0) & (pixels[:, 1] < self.height))
+            pixels = pixels[inside]
+            frame[pixels[:, 1], pixels[:, 0]] = VERTEX_COLOR
+
+        pixels = self.project(joints)
+        for start, end in SKELETON_CONNECTIONS:
+            cv2.line(frame, tuple(pixels[start]), tuple(pixels[end]), BONE_COLOR, 2, cv2.LINE_AA)
+        for x, y in pixels:
+            cv2.circle(frame, (int(x), int(y)), 5, JOINT_COLOR, -1, cv2.LINE_AA)
+            cv2.circle(frame, (int(x), int(y)), 5, BONE_COLOR, 1, cv2.LINE_AA)
+
+        if self.title:
+            cv2.putText(frame, self.title, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, BONE_COLOR, 2, cv2.LINE_AA)
+        return frame
+
+
+class FFmpegPipeWriter:
+    """Streams raw BGR frames into an ffmpeg process that encodes them to output_path."""
+
+    def __init__(self, output_path, width, height, fps=30, bitrate="1800k", codec="libx264"):
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("ffmpeg is required to write animations.")
+        command = [
+            "ffmpeg", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+            "-c:v", codec, "-b:v", bitrate, "-pix_fmt", "yuv420p", output_path,
+        ]
+        self.output_path = output_path
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(frame.data)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to write {self.output_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.process.kill()
+            self.process.wait()
+
+
+def render_skeleton_video(joints, output_path, vertices=None, fps=30, renderer=None):
+    """
+    Render joints of shape (T, J, 3), and optionally vertices of shape (T, V, 3), to a video at output_path.
+    """
+    joints = np.asarray(joints, dtype=np.float32)
+    renderer = renderer if renderer is not None else SkeletonRenderer().fit(joints)
+    with FFmpegPipeWriter(output_path, renderer.width, renderer.height, fps) as writer:
+        for i in range(len(joints)):
+            writer.write(renderer.render(joints[i], vertices[i] if vertices is not None else None))
+    return output_path
+
+
+def _render_segment(joints, vertices, output_path, fps, renderer):
+    # Every segment draws into its own frame buffer
+    return render_skeleton_video(joints, output_path, vertices=vertices, fps=fps, renderer=copy.deepcopy(renderer))
+
+
+def concat_videos(segment_paths, output_path):
+    """Join videos encoded with the same settings into output_path without re-encoding."""
+    list_path = output_path + ".segments.txt"
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    try:
+        subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+                        "-c", "copy", output_path], check=True)
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def render_skeleton_video_parallel(joints, output_path, vertices=None, fps=30, num_workers=None, min_chunk_frames=150):
+    """
+    render_skeleton_video with the frame range split into contiguous chunks rendered by a thread pool.
+    Every worker encodes its chunk to a segment, and the segments are concatenated losslessly. Threads are
+    enough: OpenCV drawing releases the GIL and the encoding runs in the ffmpeg subprocesses. Recordings
+    shorter than two chunks of min_chunk_frames are rendered in the calling thread.
+    """
+    joints = np.asarray(joints, dtype=np.float32)
+    num_workers = num_workers or os.cpu_count() or 1
+    num_chunks = min(num_workers, len(joints) // min_chunk_frames)
+    # Fitted once, so every segment uses the same projection
+    renderer = SkeletonRenderer().fit(joints)
+    if num_chunks < 2:
+        return render_skeleton_video(joints, output_path, vertices=vertices, fps=fps, renderer=renderer)
+
+    chunk_frames = math.ceil(len(joints) / num_chunks)
+    bounds = [(start, min(start + chunk_frames, len(joints))) for start in range(0, len(joints), chunk_frames)]
+    segment_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with ThreadPoolExecutor(len(bounds), thread_name_prefix="render") as pool:
+            futures = [
+                pool.submit(_render_segment, joints[start:end], vertices[start:end] if vertices is not None else None,
+                            os.path.join(segment_dir, f"{i:04d}.mp4"), fps, renderer)
+                for i, (start, end) in enumerate(bounds)
+            ]
+            segment_paths = [future.result() for future in futures]
+        return concat_videos(segment_paths, output_path)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), persist=True):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.persist = persist
+
+
+class StageMemo:
+    """
+    Results of the completed stages of one job, saved as JSON at path so that a retried job skips them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.results = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.results = json.load(f)
+
+    def __contains__(self, name):
+        return name in self.results
+
+    def get(self, name):
+        return self.results[name]
+
+    def put(self, name, result):
+        with self._lock:
+            self.results[name] = result
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.results, f)
+            os.replace(tmp_path, self.path)
+
+
+class StageGraph:
+    """
+    Stages of a job with explicit dependencies, run on a thread pool as soon as their dependencies are done,
+    so that independent stages overlap.
+
+    A stage function receives the results of its dependencies as keyword arguments named after them. With a
+    StageMemo, the results of persisted stages are saved as they complete and a rerun after a failure skips
+    them. Stages with persist=False (results that are not JSON, or cheap to recompute) run again when a stage
+    depending on them has to run.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, func, deps=(), persist=True):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name, func, deps, persist)
+        return self
+
+    def _needed(self, memo):
+        """Names of the stages that must run: not memoised, or not persisted and needed by a stage that runs."""
+        if memo is None:
+            return set(self.stages)
+        needed = set()
+        # Stages are added after their dependencies, so dependents are visited first in reverse order
+        for name in reversed(list(self.stages)):
+            dependents = [other for other in self.stages.values() if name in other.deps]
+            if self.stages[name].persist:
+                run = name not in memo
+            else:
+                run = not dependents or any(other.name in needed for other in dependents)
+            if run:
+                needed.add(name)
+        return needed
+
+    def run(self, memo=None, max_workers=2):
+        """
+        Run the graph, returns the results of the stages by name; non-persisted stages skipped on a rerun have
+        none. Raises the first stage error.
+        """
+        needed = self._needed(memo)
+        # Skipped stages are memoised, except non-persisted ones that no running stage needs: those are left out
+        results = {name: memo.get(name) for name in self.stages if name not in needed and self.stages[name].persist}
+        for name in results:
+            print(f"Stage {name}: already completed")
+
+        pending = [name for name in self.stages if name in needed]
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+            while pending or running:
+                if error is None:
+                    for name in [name for name in pending if all(dep in results for dep in self.stages[name].deps)]:
+                        stage = self.stages[name]
+                        pending.remove(name)
+                        print(f"Stage {name}: started")
+                        running[pool.submit(stage.func, **{dep: results[dep] for dep in stage.deps})] = name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        print(f"Stage {name}: failed with {e}")
+                        error = error or e
+                        continue
+                    print(f"Stage {name}: completed")
+                    if memo is not None and self.stages[name].persist:
+                        memo.put(name, results[name])
+
+        if error is not None:
+            raise error
+        return results
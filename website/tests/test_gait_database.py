@@ -0,0 +1,48 @@
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+import db
+from gait_embedding import CODE_DIM, pool_gait_signature
+
+
+@pytest.fixture
+def gait_database(tmp_path, monkeypatch):
+    # A fresh database, index and module state in tmp_path for every test
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db, "GAIT_DATABASE_URL", f"sqlite:///{tmp_path / 'gait_recognition.db'}")
+    sys.modules.pop("gait_database", None)
+    module = importlib.import_module("gait_database")
+    yield module
+    sys.modules.pop("gait_database", None)
+
+
+def walk(rng, offset=0.0, frames=120):
+    return rng.normal(offset, 1.0, (frames, CODE_DIM)).astype(np.float32)
+
+
+def enroll(gait_database, codes):
+    return gait_database.insert_gait_signature(codes.tobytes(), pool_gait_signature(codes))
+
+
+@pytest.mark.parametrize("num_others", [0, 1])
+def test_near_identical_walks_match_in_small_gallery(gait_database, num_others):
+    rng = np.random.default_rng(0)
+    for i in range(num_others):
+        enroll(gait_database, walk(rng, offset=-1.0 - i))
+    codes = walk(rng, offset=1.0)
+    first = enroll(gait_database, codes)
+    second = enroll(gait_database, codes + rng.normal(0, 0.2, codes.shape).astype(np.float32))
+    assert first != second
+    assert len(gait_database.gallery) == num_others + 2
+
+    session = gait_database.Session()
+    try:
+        probe = pool_gait_signature(codes + rng.normal(0, 0.2, codes.shape).astype(np.float32))
+        matches = gait_database.search_gallery(session, probe, k=1, exclude_person_id=second)
+    finally:
+        session.close()
+    assert matches[0].person_id == first
+    assert matches[0].score > gait_database.IDENTIFICATION_THRESHOLD
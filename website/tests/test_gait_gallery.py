@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from gait_gallery import GaitGallery
+
+
+def random_gallery(rng, num_entries, num_persons, dim=64):
+    gallery = GaitGallery()
+    for gait_id in range(1, num_entries + 1):
+        gallery.add(gait_id, int(rng.integers(1, num_persons + 1)), rng.normal(size=dim))
+    return gallery
+
+
+def assert_matches_top_k(gallery, probes, k, exclude_person_ids=None, **kwargs):
+    persons, gait_ids, scores = gallery.top_k_batch(probes, k, exclude_person_ids, **kwargs)
+    assert persons.shape == gait_ids.shape == scores.shape == (len(probes), min(k, len(gallery.rows_by_person)))
+    for i, probe in enumerate(probes):
+        expected = gallery.top_k(probe, k, None if exclude_person_ids is None else exclude_person_ids[i])
+        n = len(expected)
+        assert persons[i, :n].tolist() == [match.person_id for match in expected]
+        assert gait_ids[i, :n].tolist() == [match.gait_id for match in expected]
+        np.testing.assert_allclose(scores[i, :n], [match.score for match in expected], atol=1e-5)
+        # Slots without a person left to match
+        assert (persons[i, n:] == -1).all() and (gait_ids[i, n:] == -1).all() and np.isnan(scores[i, n:]).all()
+
+
+@pytest.mark.parametrize("k", [1, 3])
+def test_top_k_batch_equals_top_k(k):
+    rng = np.random.default_rng(0)
+    gallery = random_gallery(rng, 300, 40)
+    probes = rng.normal(size=(200, 64))
+    # Small blocks, so that the probes are scored in several of them
+    assert_matches_top_k(gallery, probes, k, max_block_elements=300 * 16)
+
+
+@pytest.mark.parametrize("k", [1, 3])
+def test_top_k_batch_equals_top_k_with_exclusions(k):
+    rng = np.random.default_rng(1)
+    gallery = random_gallery(rng, 300, 40)
+    probes = rng.normal(size=(200, 64))
+    exclude_person_ids = rng.integers(1, 41, len(probes))
+    assert_matches_top_k(gallery, probes, k, exclude_person_ids, max_block_elements=300 * 16)
+
+
+def test_top_k_batch_with_every_candidate_of_a_block_excluded():
+    rng = np.random.default_rng(2)
+    gallery = random_gallery(rng, 5, 1)
+    probes = rng.normal(size=(10, 64))
+    assert_matches_top_k(gallery, probes, 1, np.ones(len(probes), dtype=np.int64), max_block_elements=5 * 4)
+
+    persons, gait_ids, scores = gallery.top_k_batch(gallery.matrix[:len(gallery)], 1, np.ones(5, dtype=np.int64),
+                                                    fitted=True)
+    assert (persons == -1).all() and (gait_ids == -1).all() and np.isnan(scores).all()
+
+
+def test_top_k_batch_with_k_above_remaining_candidates():
+    rng = np.random.default_rng(3)
+    gallery = random_gallery(rng, 12, 3)
+    probes = rng.normal(size=(20, 64))
+    assert_matches_top_k(gallery, probes, 5)
+    assert_matches_top_k(gallery, probes, 5, rng.integers(1, 4, len(probes)))
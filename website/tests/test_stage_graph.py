@@ -0,0 +1,46 @@
+from stage_graph import StageGraph, StageMemo
+
+
+def build_graph(calls):
+    def stage(name, value):
+        def run(**deps):
+            calls.append(name)
+            return value + sum(deps.values())
+        return run
+
+    graph = StageGraph()
+    graph.add("track", stage("track", 1))
+    graph.add("preprocess", stage("preprocess", 10), deps=["track"], persist=False)
+    graph.add("animate", stage("animate", 100), deps=["preprocess"])
+    graph.add("enroll", stage("enroll", 1000), deps=["preprocess"])
+    return graph
+
+
+def test_run_computes_every_stage(tmp_path):
+    calls = []
+    results = build_graph(calls).run(StageMemo(str(tmp_path / "stages.json")))
+    assert results == {"track": 1, "preprocess": 11, "animate": 111, "enroll": 1011}
+    assert sorted(calls) == ["animate", "enroll", "preprocess", "track"]
+
+
+def test_rerun_of_fully_memoised_graph_skips_every_stage(tmp_path):
+    memo_path = str(tmp_path / "stages.json")
+    build_graph([]).run(StageMemo(memo_path))
+
+    calls = []
+    results = build_graph(calls).run(StageMemo(memo_path))
+    assert calls == []
+    # The non-persisted stage is not memoised, so it has no result
+    assert results == {"track": 1, "animate": 111, "enroll": 1011}
+
+
+def test_rerun_recomputes_non_persisted_dependencies_of_missing_stages(tmp_path):
+    memo_path = str(tmp_path / "stages.json")
+    build_graph([]).run(StageMemo(memo_path))
+    memo = StageMemo(memo_path)
+    del memo.results["enroll"]
+
+    calls = []
+    results = build_graph(calls).run(memo)
+    assert sorted(calls) == ["enroll", "preprocess"]
+    assert results["enroll"] == 1011
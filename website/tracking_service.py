@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from hmr2.utils.frame_store import AsyncFrameSink, FrameStore
+
+# track.py lives in the repository root, next to the website directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+@dataclass
+class TrackingResult:
+    video_path: str
+    output_dir: str
+    mesh_video_path: str  # Rendered PHALP video
+    frame_store: Optional[str]  # Recorded SMPL outputs
+    result: Any  # Return value of PHALP.track()
+
+
+class TrackingService:
+    """
+    Keeps one HMR2/PHALP tracker resident and runs tracking jobs on it.
+
+    The config is composed, the checkpoints are downloaded and the models (HMR2, detector, pose predictor) are
+    loaded once, on first use or on warmup(). Jobs are queued and run one at a time on a single worker thread,
+    since they all share the same models and GPU.
+    """
+
+    def __init__(self, overrides: Optional[List[str]] = None):
+        # Hydra overrides of track.py's config, e.g. ["render.enable=False"]
+        self.overrides = list(overrides or [])
+        self.tracker = None
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tracking')
+
+    def load(self):
+        with self._load_lock:
+            if self.tracker is None:
+                from hydra import compose, initialize
+                import track  # Registers the tracker config
+
+                # Recording is attached per job
+                with initialize(version_base="1.2", config_path=None):
+                    cfg = compose(config_name="config", overrides=self.overrides + ["smpl_frame_store=null"])
+                self.tracker = track.HMR2_4dhuman(cfg)
+                print("Tracking models loaded.")
+        return self.tracker
+
+    def warmup(self) -> Future:
+        """Load the models in the background."""
+        return self._executor.submit(self.load)
+
+    def _run(self, video_path: str, output_dir: str, frame_store: Optional[str]) -> TrackingResult:
+        tracker = self.load()
+        cfg = tracker.cfg
+        cfg.video.source = video_path
+        cfg.video.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+        smpl = tracker.HMAR.model.smpl
+        frame_sink = None
+        if frame_store is not None:
+            frame_sink = AsyncFrameSink(FrameStore(frame_store, overwrite=True), max_queue=cfg.smpl_frame_queue)
+        smpl.set_recording(frame_sink, record_fields=cfg.smpl_record_fields, vertex_stride=cfg.smpl_vertex_stride)
+        try:
+            result = tracker.track()
+        finally:
+            smpl.set_recording(None)
+            if frame_sink is not None:
+                frame_sink.close()
+
+        video_name = os.path.splitext(os.path.basename(video_path))[0]
+        mesh_video_path = os.path.join(output_dir, f"PHALP_{video_name}.mp4")
+        return TrackingResult(video_path, output_dir, mesh_video_path, frame_store, result)
+
+    def submit(self, video_path: str, output_dir: str, frame_store: Optional[str] = None) -> Future:
+        """
+        Queue a tracking job.
+        Args:
+            video_path (str): Input video.
+            output_dir (str): Directory for the PHALP outputs of this job.
+            frame_store (str): Directory to record the per-frame SMPL outputs to, or None to skip recording.
+        Returns:
+            Future resolving to a TrackingResult.
+        """
+        return self._executor.submit(self._run, video_path, output_dir, frame_store)
+
+    def track(self, video_path: str, output_dir: str, frame_store: Optional[str] = None) -> TrackingResult:
+        """Run a tracking job and wait for its result."""
+        return self.submit(video_path, output_dir, frame_store).result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_tracking_service() -> TrackingService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TrackingService()
+    return _service
@@ -0,0 +1,112 @@
+from collections import deque
+
+import numpy as np
+from scipy.ndimage import gaussian_filter1d
+from scipy.signal import savgol_filter
+
+# Joint trajectories have shape (T, J, 3); every filter smooths along the time axis only and works on any
+# (T, ...) array in one call.
+
+
+def gaussian_smooth(trajectory, sigma=1.0):
+    trajectory = np.asarray(trajectory, dtype=np.float32)
+    if sigma <= 0 or len(trajectory) < 2:
+        return trajectory.copy()
+    return gaussian_filter1d(trajectory, sigma=sigma, axis=0, mode='nearest')
+
+
+def savgol_smooth(trajectory, window_length=9, polyorder=2):
+    """Savitzky-Golay filter; keeps the peaks of fast movements better than a Gaussian of similar strength."""
+    trajectory = np.asarray(trajectory, dtype=np.float32)
+    # The window must be odd, longer than the polynomial order and no longer than the trajectory
+    window_length = min(window_length, len(trajectory) if len(trajectory) % 2 else len(trajectory) - 1)
+    if window_length <= polyorder:
+        return trajectory.copy()
+    return savgol_filter(trajectory, window_length, polyorder, axis=0, mode='interp').astype(np.float32)
+
+
+class OneEuroFilter:
+    """
+    Causal One-Euro filter (Casiez et al. 2012), fed one frame at a time.
+
+    A low-pass filter whose cutoff rises with the speed of the signal: slow movements are smoothed strongly
+    against jitter, fast ones with little lag. min_cutoff sets the smoothing at rest, beta how quickly it
+    relaxes with speed. Every coordinate of the frame is filtered independently.
+    """
+
+    def __init__(self, fps=30.0, min_cutoff=1.0, beta=0.007, d_cutoff=1.0):
+        self.dt = 1.0 / fps
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.x_prev = None
+        self.dx_prev = None
+
+    def _alpha(self, cutoff):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau / self.dt)
+
+    def __call__(self, frame):
+        x = np.asarray(frame, dtype=np.float32)
+        if self.x_prev is None:
+            self.x_prev = x.copy()
+            self.dx_prev = np.zeros_like(x)
+            return x.copy()
+
+        dx = (x - self.x_prev) / self.dt
+        dx_hat = self.dx_prev + self._alpha(self.d_cutoff) * (dx - self.dx_prev)
+        alpha = self._alpha(self.min_cutoff + self.beta * np.abs(dx_hat))
+        x_hat = self.x_prev + alpha * (x - self.x_prev)
+        self.x_prev, self.dx_prev = x_hat, dx_hat
+        return x_hat.astype(np.float32)
+
+    def filter(self, trajectory):
+        self.reset()
+        return np.stack([self(frame) for frame in trajectory]) if len(trajectory) else np.asarray(trajectory, dtype=np.float32)
+
+
+class CausalGaussianFilter:
+    """
+    Streaming counterpart of gaussian_smooth: every frame is averaged with the frames before it, weighted by
+    the right half of a Gaussian, so a frame can be smoothed as soon as it comes out of tracking.
+    """
+
+    def __init__(self, sigma=1.0):
+        radius = max(int(np.ceil(3 * sigma)), 0)
+        weights = np.exp(-0.5 * (np.arange(radius + 1) / sigma) ** 2) if sigma > 0 else np.ones(1)
+        self.weights = weights.astype(np.float32)  # weights[k] is the weight of the frame k steps back
+        self.history = deque(maxlen=len(weights))
+
+    def reset(self):
+        self.history.clear()
+
+    def __call__(self, frame):
+        self.history.appendleft(np.asarray(frame, dtype=np.float32))
+        weights = self.weights[:len(self.history)]
+        return np.tensordot(weights / weights.sum(), np.stack(self.history), axes=1)
+
+    def filter(self, trajectory):
+        self.reset()
+        return np.stack([self(frame) for frame in trajectory]) if len(trajectory) else np.asarray(trajectory, dtype=np.float32)
+
+
+def one_euro_smooth(trajectory, fps=30.0, min_cutoff=1.0, beta=0.007, d_cutoff=1.0):
+    return OneEuroFilter(fps, min_cutoff, beta, d_cutoff).filter(trajectory)
+
+
+SMOOTHING_METHODS = {
+    'gaussian': gaussian_smooth,
+    'savgol': savgol_smooth,
+    'one_euro': one_euro_smooth,
+    'causal_gaussian': lambda trajectory, sigma=1.0: CausalGaussianFilter(sigma).filter(trajectory),
+}
+
+
+def smooth_trajectory(trajectory, method='gaussian', **params):
+    """Smooth a (T, ...) trajectory along time with one of SMOOTHING_METHODS."""
+    if method not in SMOOTHING_METHODS:
+        raise ValueError(f"Unknown smoothing method: {method}")
+    return SMOOTHING_METHODS[method](trajectory, **params)
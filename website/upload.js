@@ -20,33 +20,89 @@ document.addEventListener("DOMContentLoaded", function () {
             return;
         }
 
-        const formData = new FormData();
-        formData.append("video", file);
-
-        const xhr = new XMLHttpRequest();
-        xhr.open("POST", "/upload", true);
-
-        // Update progress bar
-        xhr.upload.onprogress = function (event) {
-            if (event.lengthComputable) {
-                const percentComplete = (event.loaded / event.total) * 100;
-                progressBar.style.width = percentComplete + "%";
-            }
-        };
-
         // Show progress bar
         progressContainer.style.display = "block";
 
-        xhr.onload = function () {
-            if (xhr.status === 201) {
+        uploadInChunks(file)
+            .then(result => {
                 uploadStatus.innerText = "Upload successful!";
                 progressBar.style.backgroundColor = "#28a745";
-            } else {
+                pollJob(result.job_id);
+            })
+            .catch(error => {
+                console.error("Upload failed:", error);
                 uploadStatus.innerText = "Upload failed. Please try again.";
                 progressBar.style.backgroundColor = "red";
+            });
+    });
+
+    const CHUNK_SIZE = 8 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+
+    // Upload the file in chunks; after a failed chunk, resume from the offset the server reports
+    async function uploadInChunks(file) {
+        let response = await fetch("/uploads", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        if (!response.ok) {
+            throw new Error(`Could not start upload (${response.status})`);
+        }
+        let upload = await response.json();
+        let retries = 0;
+
+        while (true) {
+            const chunk = file.slice(upload.offset, upload.offset + CHUNK_SIZE);
+            try {
+                response = await fetch(`/uploads/${upload.upload_id}?offset=${upload.offset}`, {
+                    method: "PUT",
+                    headers: { "Content-Type": "application/octet-stream" },
+                    body: chunk
+                });
+            } catch (error) {
+                response = null;
             }
-        };
 
-        xhr.send(formData);
-    });
+            if (response && response.status === 201) {
+                progressBar.style.width = "100%";
+                return await response.json();
+            }
+            if (response && (response.ok || response.status === 409)) {
+                const status = await response.json();
+                upload.offset = status.offset;
+                retries = 0;
+            } else {
+                if (++retries > MAX_RETRIES) {
+                    throw new Error("Too many failed chunks");
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                const status = await fetch(`/uploads/${upload.upload_id}`)
+                    .then(r => (r.ok ? r.json() : null))
+                    .catch(() => null);
+                if (status && status.job_id !== undefined) {
+                    // The last chunk was stored but its response was lost
+                    progressBar.style.width = "100%";
+                    return status;
+                }
+                if (status) {
+                    upload.offset = status.offset;
+                }
+            }
+            progressBar.style.width = (upload.offset / file.size) * 100 + "%";
+        }
+    }
+
+    // Show the state of the analysis job until it finishes
+    function pollJob(jobId) {
+        fetch(`/jobs/${jobId}`)
+            .then(response => response.json())
+            .then(job => {
+                uploadStatus.innerText = `Upload successful! Analysis ${job.state}.`;
+                if (job.state === "queued" || job.state === "running") {
+                    setTimeout(() => pollJob(jobId), 5000);
+                }
+            })
+            .catch(error => console.error("Error fetching job status:", error));
+    }
 });
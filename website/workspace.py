@@ -0,0 +1,61 @@
+import os
+import shutil
+
+WORKSPACE_ROOT = "/content/drive/MyDrive/4D-Humans/website/jobs"
+
+
+class JobWorkspace:
+    """
+    Private directory holding every intermediate file of one analysis job, so that concurrent jobs never share
+    paths. Use as a context manager to remove it once the job has succeeded; after a failure it is kept, so
+    that the retry resumes from the stages already completed.
+    """
+
+    def __init__(self, job_id, root=WORKSPACE_ROOT):
+        self.job_id = job_id
+        self.path = os.path.join(root, str(job_id))
+
+    @property
+    def video_path(self):
+        # Uploaded video, copied out of the database
+        return os.path.join(self.path, "video.mp4")
+
+    @property
+    def tracking_dir(self):
+        # PHALP outputs: extracted frames, results and the rendered mesh video
+        return os.path.join(self.path, "tracking")
+
+    @property
+    def smpl_frames(self):
+        # SMPL outputs recorded during tracking
+        return os.path.join(self.path, "smpl")
+
+    @property
+    def preprocessed_walk(self):
+        # Structured array of the preprocessed frames, saved with np.save
+        return os.path.join(self.path, "walk.npy")
+
+    @property
+    def animation_path(self):
+        return os.path.join(self.path, "animation.mp4")
+
+    @property
+    def stage_memo(self):
+        # Results of the completed stages
+        return os.path.join(self.path, "stages.json")
+
+    def create(self):
+        os.makedirs(self.path, exist_ok=True)
+        return self
+
+    def cleanup(self):
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+
+    def __enter__(self):
+        return self.create()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.cleanup()
+        return False